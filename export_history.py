@@ -0,0 +1,187 @@
+from argparse import ArgumentParser
+import calendar
+import csv
+import gzip
+import io
+import json
+import os
+import sqlite3
+import sys
+import time
+
+PY2 = sys.version_info[0] == 2
+
+COLUMNS = ('arena_id', 'account_id', 'player_name', 'vehicle', 'map_name',
+           'start_time', 'duration', 'win', 'damage', 'kills', 'points')
+
+DEFAULT_DB = os.path.join('mods', 'configs', 'under_pressure', 'widget_history.db')
+AGGREGATES_MODULE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 'source', 'widget', 'history', 'aggregates.py')
+
+
+def parse_time(value):
+    if value is None:
+        return None
+    if value.isdigit():
+        return int(value)
+    return calendar.timegm(time.strptime(value, '%Y-%m-%d'))
+
+
+def build_query(since=None, until=None, accounts=None, vehicles=None):
+    clauses = []
+    params = []
+    if since is not None:
+        clauses.append("start_time >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("start_time < ?")
+        params.append(until)
+    if accounts:
+        clauses.append("account_id IN ({})".format(', '.join('?' * len(accounts))))
+        params.extend(accounts)
+    if vehicles:
+        clauses.append("vehicle IN ({})".format(', '.join('?' * len(vehicles))))
+        params.extend(vehicles)
+
+    sql = "SELECT {} FROM battles".format(', '.join(COLUMNS))
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY start_time, arena_id"
+    return sql, params
+
+
+def iter_battles(db_path, batch_size=500, **filters):
+    conn = sqlite3.connect(db_path)
+    try:
+        sql, params = build_query(**filters)
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(zip(COLUMNS, row))
+    finally:
+        conn.close()
+
+
+def iter_csv(rows):
+    buffer = io.BytesIO() if PY2 else io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush(values):
+        if PY2:
+            values = [value.encode('utf-8') if isinstance(value, unicode) else value for value in values]
+        writer.writerow(values)
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return data if PY2 else data.encode('utf-8')
+
+    yield flush(COLUMNS)
+    for row in rows:
+        yield flush([row[column] for column in COLUMNS])
+
+
+def iter_jsonl(rows):
+    for row in rows:
+        line = json.dumps(row, ensure_ascii=False, separators=(',', ':')) + u'\n'
+        yield line.encode('utf-8') if not isinstance(line, bytes) else line
+
+
+def open_output(path, compress):
+    if path == '-':
+        stream = sys.stdout if PY2 else sys.stdout.buffer
+        if compress:
+            return gzip.GzipFile(fileobj=stream, mode='wb')
+        return stream
+    if compress:
+        return gzip.open(path, 'wb')
+    return open(path, 'wb')
+
+
+def export(db_path, output, fmt='csv', compress=False, **filters):
+    rows = iter_battles(db_path, **filters)
+    chunks = iter_csv(rows) if fmt == 'csv' else iter_jsonl(rows)
+    stream = open_output(output, compress)
+    count = -1 if fmt == 'csv' else 0
+    try:
+        for chunk in chunks:
+            stream.write(chunk)
+            count += 1
+    finally:
+        if output != '-' or compress:
+            stream.close()
+        else:
+            stream.flush()
+    return count
+
+
+def load_aggregates(path=AGGREGATES_MODULE):
+    # The mod package imports the game client, so the aggregate SQL is loaded
+    # straight from its module file.
+    if PY2:
+        import imp
+        return imp.load_source('widget_history_aggregates', path)
+    import importlib.util
+    spec = importlib.util.spec_from_file_location('widget_history_aggregates', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def rebuild_aggregates(db_path):
+    aggregates = load_aggregates()
+    conn = sqlite3.connect(db_path, timeout=5.0, isolation_level=None)
+    try:
+        aggregates.create_schema(conn)
+        conn.execute("BEGIN")
+        try:
+            aggregates.rebuild(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return conn.execute("SELECT COUNT(*) FROM battle_aggregates").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = ArgumentParser(description="Export widget battle history to CSV or JSON Lines")
+    parser.add_argument("-d", "--db", default=DEFAULT_DB, help="path to widget_history.db")
+    parser.add_argument("-o", "--output", default="-", help="output file, '-' for stdout")
+    parser.add_argument("-f", "--format", choices=("csv", "jsonl"), default="csv", help="output format")
+    parser.add_argument("-z", "--gzip", action="store_true", help="gzip the output (implied by a .gz output name)")
+    parser.add_argument("--since", help="first day (YYYY-MM-DD, UTC) or unix timestamp")
+    parser.add_argument("--until", help="end day, exclusive (YYYY-MM-DD, UTC) or unix timestamp")
+    parser.add_argument("-a", "--account", type=int, action="append", help="account ID, repeatable")
+    parser.add_argument("--vehicle", action="append", help="vehicle name, repeatable")
+    parser.add_argument("--rebuild-aggregates", action="store_true",
+                        help="recompute the per-vehicle/map/day aggregates from the battles table and exit")
+    args = parser.parse_args(argv)
+
+    if not os.path.isfile(args.db):
+        parser.error("History database not found: {}".format(args.db))
+
+    if args.rebuild_aggregates:
+        started = time.time()
+        count = rebuild_aggregates(args.db)
+        sys.stderr.write("Rebuilt {} aggregate row(s) in {:.2f}s\n".format(count, time.time() - started))
+        return
+
+    vehicles = args.vehicle
+    if PY2 and vehicles:
+        vehicles = [vehicle.decode('utf-8') for vehicle in vehicles]
+
+    count = export(
+        args.db, args.output, args.format,
+        compress=args.gzip or args.output.endswith('.gz'),
+        since=parse_time(args.since), until=parse_time(args.until),
+        accounts=args.account, vehicles=vehicles
+    )
+    sys.stderr.write("Exported {} battle(s)\n".format(count))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,37 @@
+import os
+import time
 from widget.provider import initialize_providers, finalize_providers
-from widget.utils import print_error, print_log
+from widget.settings import g_config
+from widget.history import g_historyStore
+from widget.server import SHUTDOWN_TIMEOUT
+from widget.utils import print_error, print_log, g_metrics
 
 __version__ = "0.0.3" 
 __author__ = "Under_Pressure"
 __copyright__ = "Copyright 2025, Under_Pressure"
 __mod_name__ = "Widget"
 
+METRICS_DUMP_PATH = os.path.join('mods', 'configs', 'under_pressure', 'widget_metrics.json')
+
 
 def init():
     try:
         print_log('MOD {} START LOADING: v{}'. format(__mod_name__, __version__))
         initialize_providers()
+        if g_config.configParams.metricsDump.value:
+            g_metrics.start_dump(METRICS_DUMP_PATH)
     except Exception as e:
         print_error("Error initializing providers: {}".format(e))
 
 def fini():
     try:
         print_log('MOD {} START FINALIZING'.format(__mod_name__))
+        # History writes drain while the network shuts down; both share one deadline.
+        deadline = time.time() + SHUTDOWN_TIMEOUT
+        g_historyStore.begin_close()
         finalize_providers()
+        g_historyStore.close(deadline)
+        if g_config.configParams.metricsDump.value:
+            g_metrics.stop_dump(METRICS_DUMP_PATH)
     except Exception as e:
         print_error("Error finalizing providers: {}".format(e))
\ No newline at end of file
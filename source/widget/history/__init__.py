@@ -0,0 +1,8 @@
+from .store import HistoryStore, HISTORY_DB_PATH
+
+__all__ = [
+    'g_historyStore',
+    'HISTORY_DB_PATH',
+]
+
+g_historyStore = HistoryStore()
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+import math
+import time
+
+DIMENSION_VEHICLE = 'vehicle'
+DIMENSION_MAP = 'map'
+DIMENSION_DAY = 'day'
+
+DIMENSIONS = (DIMENSION_VEHICLE, DIMENSION_MAP, DIMENSION_DAY)
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS battle_aggregates (
+        account_id INTEGER NOT NULL,
+        dimension TEXT NOT NULL,
+        key TEXT NOT NULL,
+        battles INTEGER NOT NULL DEFAULT 0,
+        wins INTEGER NOT NULL DEFAULT 0,
+        kills_sum INTEGER NOT NULL DEFAULT 0,
+        damage_sum INTEGER NOT NULL DEFAULT 0,
+        damage_sumsq REAL NOT NULL DEFAULT 0,
+        damage_min INTEGER,
+        damage_max INTEGER,
+        points_sum INTEGER NOT NULL DEFAULT 0,
+        points_sumsq REAL NOT NULL DEFAULT 0,
+        points_min INTEGER,
+        points_max INTEGER,
+        PRIMARY KEY (account_id, dimension, key)
+    )""",
+)
+
+UPDATE_AGGREGATE = """UPDATE battle_aggregates SET
+    battles = battles + 1, wins = wins + ?, kills_sum = kills_sum + ?,
+    damage_sum = damage_sum + ?, damage_sumsq = damage_sumsq + ?,
+    damage_min = MIN(damage_min, ?), damage_max = MAX(damage_max, ?),
+    points_sum = points_sum + ?, points_sumsq = points_sumsq + ?,
+    points_min = MIN(points_min, ?), points_max = MAX(points_max, ?)
+    WHERE account_id = ? AND dimension = ? AND key = ?"""
+
+INSERT_AGGREGATE = """INSERT INTO battle_aggregates
+    (account_id, dimension, key, battles, wins, kills_sum, damage_sum, damage_sumsq,
+     damage_min, damage_max, points_sum, points_sumsq, points_min, points_max)
+    VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+
+# Same grouping as aggregate_keys(), expressed in SQL for rebuilds.
+KEY_EXPRESSIONS = {
+    DIMENSION_VEHICLE: "COALESCE(vehicle, '')",
+    DIMENSION_MAP: "COALESCE(map_name, '')",
+    DIMENSION_DAY: "strftime('%Y-%m-%d', start_time, 'unixepoch', 'localtime')",
+}
+
+REBUILD_AGGREGATE = """INSERT INTO battle_aggregates
+    (account_id, dimension, key, battles, wins, kills_sum, damage_sum, damage_sumsq,
+     damage_min, damage_max, points_sum, points_sumsq, points_min, points_max)
+    SELECT account_id, ?, {key}, COUNT(*), SUM(win = 1), SUM(kills),
+        SUM(damage), SUM(damage * damage), MIN(damage), MAX(damage),
+        SUM(points), SUM(points * points), MIN(points), MAX(points)
+    FROM battles {where} GROUP BY account_id, {key}"""
+
+
+def day_key(timestamp):
+    return time.strftime('%Y-%m-%d', time.localtime(timestamp))
+
+
+def aggregate_keys(vehicle, map_name, start_time):
+    return (
+        (DIMENSION_VEHICLE, vehicle or u''),
+        (DIMENSION_MAP, map_name or u''),
+        (DIMENSION_DAY, day_key(start_time)),
+    )
+
+
+def create_schema(conn):
+    for statement in SCHEMA:
+        conn.execute(statement)
+
+
+def apply_battle(conn, account_id, vehicle, map_name, start_time, win, damage, kills, points):
+    won = 1 if win == 1 else 0
+    for dimension, key in aggregate_keys(vehicle, map_name, start_time):
+        cursor = conn.execute(UPDATE_AGGREGATE, (
+            won, kills, damage, damage * damage, damage, damage,
+            points, points * points, points, points,
+            account_id, dimension, key))
+        if cursor.rowcount == 0:
+            conn.execute(INSERT_AGGREGATE, (
+                account_id, dimension, key, won, kills, damage, damage * damage,
+                damage, damage, points, points * points, points, points))
+
+
+def rebuild(conn, account_id=None, keys=None):
+    # keys: optional iterable of (dimension, key) to recompute for account_id;
+    # with no arguments every aggregate row is rebuilt from the battles table.
+    if account_id is None:
+        conn.execute("DELETE FROM battle_aggregates")
+        for dimension in DIMENSIONS:
+            conn.execute(REBUILD_AGGREGATE.format(key=KEY_EXPRESSIONS[dimension], where=''), (dimension,))
+        return
+
+    for dimension, key in keys or ():
+        expression = KEY_EXPRESSIONS[dimension]
+        conn.execute("DELETE FROM battle_aggregates WHERE account_id = ? AND dimension = ? AND key = ?",
+                     (account_id, dimension, key))
+        conn.execute(REBUILD_AGGREGATE.format(
+            key=expression, where="WHERE account_id = ? AND {} = ?".format(expression)),
+            (dimension, account_id, key))
+
+
+def summarize(row):
+    if not row or not row.get('battles'):
+        return None
+    battles = row['battles']
+    summary = {
+        'battles': battles,
+        'wins': row['wins'],
+        'winRate': row['wins'] / float(battles),
+        'kills': row['kills_sum'],
+        'avgKills': row['kills_sum'] / float(battles),
+    }
+    for metric in ('damage', 'points'):
+        mean = row[metric + '_sum'] / float(battles)
+        variance = max(0.0, row[metric + '_sumsq'] / float(battles) - mean * mean)
+        summary[metric] = {
+            'sum': row[metric + '_sum'],
+            'avg': mean,
+            'stddev': math.sqrt(variance),
+            'min': row[metric + '_min'],
+            'max': row[metric + '_max'],
+        }
+    return summary
+
+
+def merge_rows(rows):
+    merged = None
+    for row in rows:
+        if merged is None:
+            merged = dict(row)
+            continue
+        for field in ('battles', 'wins', 'kills_sum', 'damage_sum', 'damage_sumsq', 'points_sum', 'points_sumsq'):
+            merged[field] += row[field]
+        for metric in ('damage', 'points'):
+            merged[metric + '_min'] = min(merged[metric + '_min'], row[metric + '_min'])
+            merged[metric + '_max'] = max(merged[metric + '_max'], row[metric + '_max'])
+    return merged
@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+import os
+import threading
+import time
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+import BigWorld
+
+from ..utils import print_debug, print_error, g_metrics
+from . import aggregates
+
+HISTORY_DB_PATH = os.path.join('mods', 'configs', 'under_pressure', 'widget_history.db')
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS battles (
+        arena_id INTEGER NOT NULL,
+        account_id INTEGER NOT NULL,
+        player_name TEXT,
+        vehicle TEXT,
+        map_name TEXT,
+        start_time INTEGER NOT NULL DEFAULT 0,
+        duration INTEGER NOT NULL DEFAULT 0,
+        win INTEGER NOT NULL DEFAULT -1,
+        damage INTEGER NOT NULL DEFAULT 0,
+        kills INTEGER NOT NULL DEFAULT 0,
+        points INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (arena_id, account_id)
+    )""",
+    "CREATE INDEX IF NOT EXISTS battles_account ON battles (account_id, start_time)",
+    "CREATE INDEX IF NOT EXISTS battles_vehicle ON battles (vehicle, start_time)",
+    "CREATE INDEX IF NOT EXISTS battles_map ON battles (map_name, start_time)",
+    "CREATE INDEX IF NOT EXISTS battles_start ON battles (start_time)",
+)
+
+BATTLE_COLUMNS = ('arena_id', 'account_id', 'player_name', 'vehicle', 'map_name',
+                  'start_time', 'duration', 'win', 'damage', 'kills', 'points')
+
+INSERT_BATTLE = "INSERT OR REPLACE INTO battles ({}) VALUES ({})".format(
+    ', '.join(BATTLE_COLUMNS), ', '.join('?' * len(BATTLE_COLUMNS)))
+
+def _fetch_rows(conn, sql, params):
+    cursor = conn.execute(sql, params)
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+_written = g_metrics.counter('history.written')
+_dropped = g_metrics.counter('history.dropped')
+_batchTime = g_metrics.histogram('history.batch_ms')
+
+
+class HistoryStore(object):
+    def __init__(self, path=HISTORY_DB_PATH, batch_size=32, flush_interval=2.0, max_pending=1000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(max_pending)
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stopping = False
+        self._results = queue.Queue()
+        self._waiting = 0
+        self._poll_id = None
+
+    @property
+    def available(self):
+        return sqlite3 is not None
+
+    def _connect(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _create_schema(self, conn):
+        for statement in SCHEMA:
+            conn.execute(statement)
+        aggregates.create_schema(conn)
+
+    def _ensure_writer(self):
+        if self._thread is not None and self._thread.is_alive():
+            return True
+        with self._thread_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return True
+            if not self.available or self._stopping:
+                return False
+            self._thread = threading.Thread(target=self._writer_loop, name='WidgetHistoryWriter')
+            self._thread.daemon = True
+            self._thread.start()
+            return True
+
+    def record_battle(self, arena_id, account_id, player_name=None, vehicle=None, map_name=None,
+                      start_time=0, duration=0, win=-1, damage=0, kills=0, points=0):
+        if not arena_id or not account_id or not self._ensure_writer():
+            return False
+        row = (int(arena_id), int(account_id), player_name, vehicle, map_name,
+               int(start_time or 0), int(duration or 0), int(win), int(damage), int(kills), int(points))
+        try:
+            self._queue.put_nowait(('battle', row))
+            return True
+        except queue.Full:
+            _dropped.inc()
+            print_error("[HistoryStore] Write queue full, battle {} dropped".format(arena_id))
+            return False
+
+    def submit_query(self, func, callback=None, *args):
+        # Runs func(conn, *args) on the writer thread and hands the result back
+        # to the game thread, so the overlay and settings UI never touch disk.
+        if not self._ensure_writer():
+            return False
+        try:
+            self._queue.put_nowait(('query', (func, args, callback)))
+        except queue.Full:
+            return False
+        if callback is not None:
+            self._waiting += 1
+            if self._poll_id is None:
+                self._poll_id = BigWorld.callback(0.1, self._poll_results)
+        return True
+
+    def _poll_results(self):
+        # BigWorld is not thread-safe, so the writer only queues results and
+        # this game-thread poll runs the callbacks.
+        self._poll_id = None
+        while True:
+            try:
+                callback, result = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._waiting -= 1
+            try:
+                callback(result)
+            except Exception as e:
+                print_error("[HistoryStore] Query callback failed: {}".format(e))
+        if self._waiting > 0 and self._thread is not None and self._thread.is_alive():
+            self._poll_id = BigWorld.callback(0.1, self._poll_results)
+
+    def _writer_loop(self):
+        try:
+            conn = self._connect()
+            self._create_schema(conn)
+        except Exception as e:
+            print_error("[HistoryStore] Failed to open {}: {}".format(self.path, e))
+            return
+
+        print_debug("[HistoryStore] Writer started: {}".format(self.path))
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self._stopping:
+                    break
+                continue
+            if item is None:
+                break
+
+            batch = []
+            queries = []
+            self._collect(item, batch, queries)
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._stopping = True
+                    break
+                self._collect(item, batch, queries)
+
+            if batch:
+                self._write_batch(conn, batch)
+            for func, args, callback in queries:
+                self._run_query(conn, func, args, callback)
+            if self._stopping and self._queue.empty():
+                break
+
+        try:
+            conn.close()
+        except Exception:
+            pass
+        print_debug("[HistoryStore] Writer stopped")
+
+    def _collect(self, item, batch, queries):
+        kind, payload = item
+        if kind == 'battle':
+            batch.append(payload)
+        elif kind == 'query':
+            queries.append(payload)
+
+    def _write_batch(self, conn, rows):
+        try:
+            with _batchTime.time():
+                conn.execute("BEGIN")
+                try:
+                    self._insert_rows(conn, rows)
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+            _written.inc(len(rows))
+        except Exception as e:
+            _dropped.inc(len(rows))
+            print_error("[HistoryStore] Failed to write {} battle(s): {}".format(len(rows), e))
+
+    def _insert_rows(self, conn, rows):
+        # Aggregates are updated in the same transaction as the raw rows. A
+        # re-recorded battle cannot be subtracted (min/max), so its old and new
+        # aggregate keys are recomputed from the raw rows instead.
+        for row in rows:
+            arena_id, account_id, _, vehicle, map_name, start_time, _, win, damage, kills, points = row
+            previous = conn.execute(
+                "SELECT vehicle, map_name, start_time FROM battles WHERE arena_id = ? AND account_id = ?",
+                (arena_id, account_id)).fetchone()
+            conn.execute(INSERT_BATTLE, row)
+            if previous is None:
+                aggregates.apply_battle(conn, account_id, vehicle, map_name, start_time, win, damage, kills, points)
+            else:
+                keys = set(aggregates.aggregate_keys(*previous))
+                keys.update(aggregates.aggregate_keys(vehicle, map_name, start_time))
+                aggregates.rebuild(conn, account_id, keys)
+
+    def _rebuild_aggregates(self, conn):
+        started = time.time()
+        conn.execute("BEGIN")
+        try:
+            aggregates.rebuild(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        print_debug("[HistoryStore] Aggregates rebuilt in {:.2f}s".format(time.time() - started))
+        return True
+
+    def rebuild_aggregates(self, callback=None):
+        return self.submit_query(self._rebuild_aggregates, callback)
+
+    def _run_query(self, conn, func, args, callback):
+        try:
+            result = func(conn, *args)
+        except Exception as e:
+            print_error("[HistoryStore] Query failed: {}".format(e))
+            result = None
+        if callback is not None:
+            self._results.put((callback, result))
+
+    def query(self, sql, params=()):
+        # Blocking read on a short-lived connection, for offline tools only;
+        # anything on the game thread goes through submit_query.
+        if not self.available or not os.path.exists(self.path):
+            return []
+        try:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            try:
+                return _fetch_rows(conn, sql, params)
+            finally:
+                conn.close()
+        except Exception as e:
+            print_error("[HistoryStore] Query failed: {}".format(e))
+            return []
+
+    def fetch(self, sql, params, callback, transform=None):
+        def run(conn):
+            rows = _fetch_rows(conn, sql, params)
+            return transform(rows) if transform is not None else rows
+        return self.submit_query(run, callback)
+
+    def recent_battles(self, account_id, callback, limit=20):
+        return self.fetch(
+            "SELECT {} FROM battles WHERE account_id = ? ORDER BY start_time DESC LIMIT ?".format(', '.join(BATTLE_COLUMNS)),
+            (int(account_id), int(limit)), callback)
+
+    def battles_between(self, account_id, start_time, end_time, callback):
+        return self.fetch(
+            "SELECT {} FROM battles WHERE account_id = ? AND start_time >= ? AND start_time < ? ORDER BY start_time".format(
+                ', '.join(BATTLE_COLUMNS)),
+            (int(account_id), int(start_time), int(end_time)), callback)
+
+    def totals_since(self, account_id, since, callback):
+        return self.fetch(
+            "SELECT COUNT(*) AS battles, COALESCE(SUM(points), 0) AS points, COALESCE(SUM(damage), 0) AS damage, "
+            "COALESCE(SUM(kills), 0) AS kills, COALESCE(SUM(win = 1), 0) AS wins "
+            "FROM battles WHERE account_id = ? AND start_time >= ?",
+            (int(account_id), int(since)), callback, lambda rows: rows[0] if rows else None)
+
+    def today_totals(self, account_id, callback):
+        now = time.localtime()
+        midnight = time.mktime((now.tm_year, now.tm_mon, now.tm_mday, 0, 0, 0, 0, 0, -1))
+        return self.totals_since(account_id, midnight, callback)
+
+    def aggregate(self, account_id, dimension, key, callback):
+        return self.fetch(
+            "SELECT * FROM battle_aggregates WHERE account_id = ? AND dimension = ? AND key = ?",
+            (int(account_id), dimension, key), callback,
+            lambda rows: aggregates.summarize(rows[0] if rows else None))
+
+    def vehicle_summary(self, account_id, vehicle, callback):
+        return self.aggregate(account_id, aggregates.DIMENSION_VEHICLE, vehicle or u'', callback)
+
+    def map_summary(self, account_id, map_name, callback):
+        return self.aggregate(account_id, aggregates.DIMENSION_MAP, map_name or u'', callback)
+
+    def day_summary(self, account_id, callback, day=None):
+        return self.aggregate(account_id, aggregates.DIMENSION_DAY, day or aggregates.day_key(time.time()), callback)
+
+    def window_summary(self, account_id, callback, days=7):
+        first_day = aggregates.day_key(time.time() - (days - 1) * 86400)
+        return self.fetch(
+            "SELECT * FROM battle_aggregates WHERE account_id = ? AND dimension = ? AND key >= ?",
+            (int(account_id), aggregates.DIMENSION_DAY, first_day), callback,
+            lambda rows: aggregates.summarize(aggregates.merge_rows(rows)))
+
+    def begin_close(self):
+        # Lets the writer drain its queue while the rest of fini runs.
+        if self._stopping:
+            return
+        self._stopping = True
+        if self._thread is not None and self._thread.is_alive():
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                pass
+
+    def close(self, deadline=None):
+        self.begin_close()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(max(0.0, deadline - time.time()) if deadline is not None else 0.0)
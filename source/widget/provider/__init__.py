@@ -3,12 +3,16 @@ from .platoon_provider import PlatoonProvider
 from .hangar_provider import HangarProvider
 from .battle_provider import BattleProvider
 from .battle_result_provider import BattleResultsProvider
+from .arena_index import ArenaVehicleIndex
+from .name_catalog import g_nameCatalog
 from ..utils import print_error
 
 __all__ = [
     'initialize_providers',
     'finalize_providers',
+    'g_arenaIndex',
 ]
+g_arenaIndex = ArenaVehicleIndex()
 g_battleProvider = None
 g_platoonProvider = None
 g_hangarProvider = None
@@ -19,8 +23,8 @@ def initialize_providers():
     try:
         g_platoonProvider = PlatoonProvider()
         g_hangarProvider = HangarProvider()
-        g_battleResultsProvider = BattleResultsProvider()
-        g_battleProvider = BattleProvider(g_battleResultsProvider)
+        g_battleResultsProvider = BattleResultsProvider(g_platoonProvider)
+        g_battleProvider = BattleProvider(g_battleResultsProvider, g_arenaIndex)
 
     except Exception as e:
         print_error("Error initializing providers: {}".format(e))
@@ -37,5 +41,6 @@ def finalize_providers():
             g_battleProvider.fini()
         if g_battleResultsProvider:
             g_battleResultsProvider.fini()
+        g_nameCatalog.fini()
     except Exception as e:
         print_error("Error finalizing providers: {}".format(e))
\ No newline at end of file
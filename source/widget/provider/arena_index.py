@@ -0,0 +1,105 @@
+import BigWorld
+
+from ..utils import print_error, print_debug
+
+ACCOUNT = 0
+TEAM = 1
+PLATOON = 2
+
+
+class ArenaVehicleIndex(object):
+    def __init__(self):
+        self.arena = None
+        self.entries = {}
+        self.ownVehicleID = 0
+        self.ownAccountID = 0
+
+    def bind(self, arena):
+        self.unbind()
+        self.arena = arena
+        self.rebuild()
+        if hasattr(arena, 'onNewVehicleListReceived'):
+            arena.onNewVehicleListReceived += self.rebuild
+        if hasattr(arena, 'onVehicleAdded'):
+            arena.onVehicleAdded += self.onVehicleChanged
+        if hasattr(arena, 'onVehicleUpdated'):
+            arena.onVehicleUpdated += self.onVehicleChanged
+
+    def unbind(self):
+        arena = self.arena
+        if arena is not None:
+            try:
+                if hasattr(arena, 'onNewVehicleListReceived'):
+                    arena.onNewVehicleListReceived -= self.rebuild
+                if hasattr(arena, 'onVehicleAdded'):
+                    arena.onVehicleAdded -= self.onVehicleChanged
+                if hasattr(arena, 'onVehicleUpdated'):
+                    arena.onVehicleUpdated -= self.onVehicleChanged
+            except Exception as e:
+                print_debug("[ArenaVehicleIndex] Error unsubscribing: {}".format(e))
+        self.arena = None
+        self.entries = {}
+        self.ownVehicleID = 0
+        self.ownAccountID = 0
+
+    def rebuild(self, *args):
+        try:
+            vehicles = getattr(self.arena, 'vehicles', None) or {}
+            self.entries = dict((vehicleID, self._entry(info)) for vehicleID, info in vehicles.items())
+            self._updateOwn()
+            print_debug("[ArenaVehicleIndex] Indexed {} vehicles".format(len(self.entries)))
+        except Exception as e:
+            print_error("[ArenaVehicleIndex] Error rebuilding index: {}".format(e))
+
+    def onVehicleChanged(self, vehicleID, *args):
+        try:
+            info = self.arena.vehicles.get(vehicleID)
+            if info is None:
+                self.entries.pop(vehicleID, None)
+            else:
+                self.entries[vehicleID] = self._entry(info)
+            if not self.ownVehicleID or vehicleID == self.ownVehicleID:
+                self._updateOwn()
+        except Exception as e:
+            print_error("[ArenaVehicleIndex] Error updating vehicle {}: {}".format(vehicleID, e))
+
+    def _entry(self, info):
+        return (info.get('accountDBID', 0) or 0, info.get('team', 0) or 0, info.get('prebattleID', 0) or 0)
+
+    def _updateOwn(self):
+        player = BigWorld.player()
+        self.ownVehicleID = (getattr(player, 'playerVehicleID', 0) or 0) if player else 0
+        entry = self.entries.get(self.ownVehicleID)
+        self.ownAccountID = entry[ACCOUNT] if entry else 0
+
+    def isOwn(self, vehicleID):
+        return vehicleID == self.ownVehicleID
+
+    def getAccountID(self, vehicleID):
+        entry = self.entries.get(vehicleID)
+        return entry[ACCOUNT] if entry else 0
+
+    def getTeam(self, vehicleID):
+        entry = self.entries.get(vehicleID)
+        return entry[TEAM] if entry else 0
+
+    def getPlatoonID(self, vehicleID):
+        entry = self.entries.get(vehicleID)
+        return entry[PLATOON] if entry else 0
+
+    def isAlly(self, vehicleID):
+        entry = self.entries.get(vehicleID)
+        own = self.entries.get(self.ownVehicleID)
+        return bool(entry and own and entry[TEAM] == own[TEAM])
+
+    def getPlatoonVehicles(self, vehicleID=None):
+        entry = self.entries.get(vehicleID or self.ownVehicleID)
+        if not entry or not entry[PLATOON]:
+            return []
+        return [vid for vid, other in self.entries.items() if other[PLATOON] == entry[PLATOON] and other[TEAM] == entry[TEAM]]
+
+    def getVehicleByAccount(self, accountDBID):
+        for vehicleID, entry in self.entries.items():
+            if entry[ACCOUNT] == accountDBID:
+                return vehicleID
+        return 0
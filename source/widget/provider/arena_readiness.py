@@ -0,0 +1,102 @@
+import BigWorld
+
+from ..utils import print_error, print_debug
+
+ARENA_EVENTS = ('onNewVehicleListReceived', 'onVehicleAdded', 'onVehicleUpdated')
+
+
+class ArenaReadyWaiter(object):
+    def __init__(self, onReady, pollInterval=0.5, maxAttempts=30):
+        self.onReady = onReady
+        self.pollInterval = pollInterval
+        self.maxAttempts = maxAttempts
+        self.arena = None
+        self.attempts = 0
+        self.callbackID = None
+        self.waiting = False
+
+    def wait(self):
+        self.cancel()
+        self.waiting = True
+        self.attempts = 0
+        self.check()
+
+    def cancel(self):
+        self.waiting = False
+        self._unsubscribe()
+        if self.callbackID is not None:
+            try:
+                BigWorld.cancelCallback(self.callbackID)
+            except Exception:
+                pass
+            self.callbackID = None
+
+    def isReady(self, player, arena):
+        vehicles = getattr(arena, 'vehicles', None)
+        if not vehicles:
+            return False
+        vehicleID = getattr(player, 'playerVehicleID', None)
+        info = vehicles.get(vehicleID) if vehicleID else None
+        return bool(info and info.get('accountDBID'))
+
+    def check(self, *args):
+        if not self.waiting:
+            return
+        try:
+            player = BigWorld.player()
+            arena = getattr(player, 'arena', None) if player else None
+            if arena is not None and arena is not self.arena:
+                self._unsubscribe()
+                self._subscribe(arena)
+            if arena is not None and self.isReady(player, arena):
+                self._finish(arena)
+                return
+        except Exception as e:
+            print_error("[ArenaReadyWaiter] Error checking arena: {}".format(e))
+        self._schedulePoll()
+
+    def _schedulePoll(self):
+        # Arena events normally finish the wait; polling only covers the
+        # window before BigWorld.player().arena exists, and is bounded. Once
+        # the budget is spent the event subscriptions stay until cancel().
+        if self.callbackID is not None:
+            return
+        if self.attempts >= self.maxAttempts:
+            if self.arena is None:
+                print_error("[ArenaReadyWaiter] No arena after {} checks, giving up".format(self.attempts))
+                self.cancel()
+            elif self.attempts == self.maxAttempts:
+                self.attempts += 1
+                print_error("[ArenaReadyWaiter] Arena not ready after {} checks, waiting for arena events".format(self.maxAttempts))
+            return
+        self.attempts += 1
+        self.callbackID = BigWorld.callback(self.pollInterval, self._poll)
+
+    def _poll(self):
+        self.callbackID = None
+        self.check()
+
+    def _finish(self, arena):
+        print_debug("[ArenaReadyWaiter] Arena ready after {} poll(s)".format(self.attempts))
+        self.cancel()
+        self.onReady(arena)
+
+    def _subscribe(self, arena):
+        self.arena = arena
+        for name in ARENA_EVENTS:
+            event = getattr(arena, name, None)
+            if event is not None:
+                event += self.check
+
+    def _unsubscribe(self):
+        arena = self.arena
+        self.arena = None
+        if arena is None:
+            return
+        for name in ARENA_EVENTS:
+            event = getattr(arena, name, None)
+            if event is not None:
+                try:
+                    event -= self.check
+                except Exception:
+                    pass
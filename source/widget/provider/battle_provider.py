@@ -5,58 +5,41 @@ from PlayerEvents import g_playerEvents
 from constants import  ARENA_PERIOD_NAMES
 from gui.battle_control import avatar_getter
 from items import vehicles
-from helpers.i18n import makeString
 from ..server import g_serverManager
 from ..settings import g_config
 from ..utils import print_error, print_debug, g_statsWrapper
+from .live_ticker import LiveUpdateTicker
+from .arena_readiness import ArenaReadyWaiter
+from .name_catalog import g_nameCatalog
+from .player_publisher import g_playerIdentity
 
 class BattleProvider():
-    def __init__(self, battleResultsProvider):
+    def __init__(self, battleResultsProvider, arenaIndex):
 
         self.battleResultsProvider = battleResultsProvider
+        self.arenaIndex = arenaIndex
         self.isBattle = False
         self.arena = None
         self.arenaUniqueID = None
         self.guiType = None
         self.playerID= None
+        self.vehicleTier = None
+        self.liveTicker = LiveUpdateTicker(onFlush=self.onLiveFlush)
+        self.arenaWaiter = ArenaReadyWaiter(onReady=self.onArenaReady)
         g_playerEvents.onAvatarReady += self.onBattleSessionStart
         g_playerEvents.onAvatarBecomeNonPlayer += self.onBattleSessionStop
 
         print_debug("[BattleProvider] Initialized")
 
-    def setArena(self):
-        try:
-            player = BigWorld.player()
-            if not player:
-                print_debug("Player not available, retrying...")
-                BigWorld.callback(2.0, self.setArena)
-                return
-                
-            arena = getattr(player, 'arena', None)
-            if not arena:
-                print_debug("[BattleProvider]No arena found, retrying...")
-                BigWorld.callback(2.0, self.setArena)
-                return
-            
-            if not hasattr(arena, 'vehicles') or not arena.vehicles:
-                print_debug("[BattleProvider] Arena vehicles not ready, retrying...")
-                BigWorld.callback(2.0, self.setArena)
-                return
-                
-            self.arena = arena
-            print_debug("[BattleProvider] Arena successfully set with {} vehicles".format(len(arena.vehicles)))
-            
-        except Exception as e:
-            print_error("[BattleProvider]Error setting arena: {}".format(e))
-            BigWorld.callback(1.0, self.setArena)
-            
+    def setArena(self, arena):
+        self.arena = arena
+        self.arenaIndex.bind(arena)
+        print_debug("[BattleProvider] Arena successfully set with {} vehicles".format(len(arena.vehicles)))
 
     def getAccountName(self):
         try:
-            player = BigWorld.player()
-            if not player:
-                return "Unknown Player"
-            return getattr(player, 'name', "Unknown Player")
+            _, name = g_playerIdentity.get()
+            return name or "Unknown Player"
         except Exception as e:
             print_error("[BattleProvider]Error getting account name: {}".format(e))
             return "Unknown Player"
@@ -66,13 +49,10 @@ class BattleProvider():
             player = BigWorld.player()
             if not player:
                 return 0
-            if self.arena and hasattr(self.arena, 'vehicles'):
-                player_vehicle_id = getattr(player, 'playerVehicleID', None)
-                if player_vehicle_id and player_vehicle_id in self.arena.vehicles:
-                    vehicle_info = self.arena.vehicles[player_vehicle_id]
-                    account_id = vehicle_info.get('accountDBID', 0)
-                    if account_id:
-                        return account_id
+            if self.arena:
+                if not self.arenaIndex.ownAccountID:
+                    self.arenaIndex.rebuild()
+                return self.arenaIndex.ownAccountID
             return 0
             
         except Exception as e:
@@ -87,7 +67,21 @@ class BattleProvider():
     def getMapName(self):
         if not self.arena:
             return "Unknown Map"
-        return makeString('#arenas:%s/name' % self.arena.arenaType.geometryName)
+        return g_nameCatalog.getMapName(self.arena.arenaType.geometryName)
+
+    def getVehicleTier(self):
+        try:
+            vid = BigWorld.player().playerVehicleID
+            if self.arena and vid in self.arena.vehicles:
+                vehicleType = self.arena.vehicles[vid].get('vehicleType')
+                if vehicleType is not None:
+                    return vehicleType.level
+            vehicle = BigWorld.entity(vid)
+            if vehicle:
+                return vehicle.typeDescriptor.level
+        except Exception as e:
+            print_debug("[BattleProvider] Error getting vehicle tier: {}".format(e))
+        return None
 
     def getVehicleName(self):
         if not self.arena:
@@ -109,15 +103,20 @@ class BattleProvider():
             print_debug("[BattleProvider] ImportError occurred")
             return
         try:
-            self.setArena()
-            if not self.arena:
-                print_debug("[BattleProvider] Arena not ready, battle session start delayed")
-                return
-            
+            g_serverManager.prewarm()
+            self.arenaWaiter.wait()
+        except Exception as e:
+            print_error("[BattleProvider] Failed to start Battle Session: {}".format(e))
+
+    def onArenaReady(self, arena):
+        try:
+            self.setArena(arena)
+
             self.guiType = getattr(self.arena, 'guiType', None)
             print_debug("[BattleProvider] guiType: {}".format(self.guiType))
             self.arenaUniqueID = getattr(self.arena, 'arenaUniqueID', 0)
             self.playerID = self.getAccountDatabaseID()
+            self.vehicleTier = self.getVehicleTier()
             self.battleResultsProvider.setArenaUniqueID(self.arenaUniqueID)
 
             if self.guiType != 1:
@@ -125,8 +124,7 @@ class BattleProvider():
                 return
             
             if not self.playerID:
-                print_debug("[BattleProvider]Player ID not available, retrying...")
-                BigWorld.callback(2.0, self.onBattleSessionStart)
+                print_error("[BattleProvider] Player ID not available in a ready arena, skipping battle session start")
                 return
 
             g_statsWrapper.create_battle(arena_id=self.arenaUniqueID, start_time=time.time(), duration=0, win=-1, map_name=self.getMapName())
@@ -144,6 +142,9 @@ class BattleProvider():
             if hasattr(self.arena, 'onPeriodChange'):
                 self.arena.onPeriodChange += self.onPeriodChange
 
+            self.liveTicker.start(self.arenaUniqueID, self.playerID, self.vehicleTier,
+                                  interval=g_config.configParams.liveUpdateInterval.value / 1000.0)
+
             print_debug("[BattleProvider] Battle session started - Player ID: {}, Arena ID: {}".format(self.playerID, self.arenaUniqueID))
             self.isBattle = True
             
@@ -154,31 +155,34 @@ class BattleProvider():
 
     def onBattleSessionStop(self):
         try:
+            self.arenaWaiter.cancel()
+            if self.arenaUniqueID:
+                self.battleResultsProvider.onBattleEnded(self.arenaUniqueID)
             if self.arena:
+                # The index is bound for every mode, so it is released before
+                # the unsupported-mode return.
+                arena, self.arena = self.arena, None
+                self.arenaIndex.unbind()
                 if self.guiType != 1:
                     print_debug("[BattleProvider] Unsupported game mode (guiType: {}), skipping battle session stop".format(self.guiType))
                     return
-                self.arena.onVehicleKilled -= self.onVehicleKilled
-                self.arena.onVehicleHealthChanged -= self.onVehicleHealthChanged
-                self.arena.onPeriodChange -= self.onPeriodChange
-                self.arena = None
+                arena.onVehicleKilled -= self.onVehicleKilled
+                arena.onVehicleHealthChanged -= self.onVehicleHealthChanged
+                arena.onPeriodChange -= self.onPeriodChange
+                self.liveTicker.stop()
+                self.liveTicker.reset()
                 self.isBattle = False
         except Exception as e:
             print_error("[BattleProvider] Failed to Battle Session Stop : {}".format(e))
 
     def isCurrentPlayer(self, attacker_id):
-        try:
-            if self.arena and self.arena.vehicles and self.playerID:
-                attacker_info = self.arena.vehicles.get(attacker_id, {})
-                attacker_account_id = attacker_info.get('accountDBID', attacker_id)
-                return attacker_account_id == self.playerID
-        except Exception as e:
-            print_debug("[BattleProvider] Error checking if current player: {}".format(e))
-        return False
+        return attacker_id == self.arenaIndex.ownVehicleID and bool(self.playerID)
 
     def onPeriodChange(self, period, periodEndTime, periodLength, periodAdditionalInfo, *args):
         period_name = ARENA_PERIOD_NAMES[period]
-        if period_name == "PREBATTLE":
+        if period_name == "AFTERBATTLE":
+            self.liveTicker.flush()
+        elif period_name == "PREBATTLE":
             pass
             # g_statsWrapper.create_battle(arena_id=self.arenaUniqueID, start_time=time.time(), duration=0, win=-1, map_name=self.getMapName())
             # g_statsWrapper.add_player_to_battle(arena_id=self.arenaUniqueID, player_id=self.playerID, name=self.getAccountName(), vehicle=self.getVehicleName())
@@ -191,15 +195,7 @@ class BattleProvider():
     def onVehicleKilled(self, target_id, attacker_id, reason, is_respawn, *args):
         try:
             if attacker_id > 0 and self.isCurrentPlayer(attacker_id):
-                
-                g_statsWrapper.add_kills(self.arenaUniqueID, self.playerID, 1)
-                g_statsWrapper.add_points(self.arenaUniqueID, self.playerID, g_statsWrapper.pointPerFrag)
-                if g_config.configParams.tournamentType.value == 'platoon':
-                    result = g_serverManager.send_stats(player_id=self.playerID)
-                    if result:
-                        print_debug("[BattleProvider] Vehicle killed info sent successfully for Player ID: {}".format(self.playerID))
-                    else:
-                        print_debug("[BattleProvider] Failed to send vehicle killed info for Player ID: {}".format(self.playerID))
+                self.liveTicker.addKill(attacker_id, target_id)
         except Exception as e:
             print_error("[BattleProvider] Error processing vehicle killed event: {}".format(e))
 
@@ -208,25 +204,26 @@ class BattleProvider():
         try:
                         
             if damage > 0 and self.isCurrentPlayer(attacker_id):
-                actual_damage = max(0, damage)
-                g_statsWrapper.add_damage(self.arenaUniqueID, self.playerID, actual_damage)
-                g_statsWrapper.add_points(self.arenaUniqueID, self.playerID, actual_damage)
-                print_debug("[BattleProvider] g_config.configParams.tournamentType.value: {}".format(g_config.configParams.tournamentType.value))
-                if g_config.configParams.tournamentType.value == 'platoon':
-                    result = g_serverManager.send_stats(player_id=self.playerID)
-                    if result:
-                        print_debug("[BattleProvider] Vehicle health changed info sent successfully for Player ID: {}".format(self.playerID))
-                    else:
-                        print_debug("[BattleProvider] Failed to send vehicle health changed info for Player ID: {}".format(self.playerID))
-        
+                self.liveTicker.addDamage(attacker_id, target_id, damage)
         except Exception as e:
             print_error("[BattleProvider] Error processing vehicle health changed event: {}".format(e))
 
+    def onLiveFlush(self, eventCount):
+        if g_config.configParams.tournamentType.value != 'platoon':
+            return
+        result = g_serverManager.send_stats(player_id=self.playerID)
+        if result:
+            print_debug("[BattleProvider] Live update with {} event(s) queued for Player ID: {}".format(eventCount, self.playerID))
+        else:
+            print_debug("[BattleProvider] Failed to queue live update for Player ID: {}".format(self.playerID))
+
     def fini(self):
         try:
+            self.liveTicker.stop()
+            self.arenaWaiter.cancel()
             g_playerEvents.onAvatarReady -= self.onBattleSessionStart
             g_playerEvents.onAvatarBecomeNonPlayer -= self.onBattleSessionStop
+            g_serverManager.shutdown()
             g_statsWrapper.clear_all_data()
-            g_serverManager.force_cleanup()
         except Exception as e:
             print_error("[BattleProvider] Error in BattleProvider.fini: {}".format(e))
\ No newline at end of file
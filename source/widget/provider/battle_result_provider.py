@@ -1,40 +1,44 @@
 import BigWorld
 import BattleReplay
 from PlayerEvents import g_playerEvents
-from items import vehicles
 
-from ..server import g_serverManager
+from ..server import g_serverManager, PRIORITY_HIGH
+from ..history import g_historyStore
 from ..settings import g_config
-from ..utils import print_error, print_debug, g_statsWrapper
+from ..utils import print_error, print_debug, g_statsWrapper, g_scoring
+from .name_catalog import g_nameCatalog
+from .results_poller import ResultsPoller, PENDING_ARENAS_PATH
+from .results_backfill import ResultsBackfill
 
 
 class BattleResultsProvider(object):
-    def __init__(self):
-        self.arenaUniqueIDs = []
+    def __init__(self, platoonProvider=None):
+        self.platoonProvider = platoonProvider
+        self.poller = ResultsPoller(onResults=self.processBattleResults, journalPath=PENDING_ARENAS_PATH)
+        self.poller.restore()
+        self.backfill = ResultsBackfill(onResults=self.processBackfill, isPending=self.poller.__contains__)
 
         g_playerEvents.onBattleResultsReceived += self.onBattleResultsReceived
-        self.battleResultsCacheLoop()
+        g_playerEvents.onAccountShowGUI += self.onAccountShowGUI
 
         print_debug("[BattleResultsProvider] Initialized")
 
     def setArenaUniqueID(self, arenaUniqueID):
-        if arenaUniqueID not in self.arenaUniqueIDs:
-            self.arenaUniqueIDs.append(arenaUniqueID)
+        self.poller.add(arenaUniqueID)
 
-    def battleResultsCacheLoop(self):
-        BigWorld.callback(1.0, self.battleResultsCacheLoop)
+    def onBattleEnded(self, arenaUniqueID):
+        self.poller.markEnded(arenaUniqueID)
 
-        def resultCallback(code, results):
-            if code > 0 and results:
-                self.processBattleResults(results)
-
-        if len(self.arenaUniqueIDs) > 0:
-            arenaID = self.arenaUniqueIDs.pop(0)
-            self.arenaUniqueIDs.append(arenaID)
-            try:
-                BigWorld.player().battleResultsCache.get(arenaID, resultCallback)
-            except Exception as e:
-                print_debug("[BattleResultsProvider] battleResultsCache error: {}".format(e))
+    def onAccountShowGUI(self, *args):
+        try:
+            if not g_config.configParams.enabled.value:
+                return
+            player = BigWorld.player()
+            accountDBID = getattr(player, 'databaseID', None)
+            if self.backfill.start(accountDBID, getattr(player, 'name', None)):
+                print_debug("[BattleResultsProvider] Backfill started for account ID: {}".format(accountDBID))
+        except Exception as e:
+            print_error("[BattleResultsProvider] Error starting backfill: {}".format(e))
 
     def onBattleResultsReceived(self, isPlayerVehicle, results):
         try:
@@ -49,88 +53,219 @@ class BattleResultsProvider(object):
             return
 
         print_debug("[BattleResultsProvider] onBattleResultsReceived called.")
-        self.processBattleResults(results)
+        self.processBattleResults(results, fromPoller=False)
 
-    def processBattleResults(self, results):
+    def processBattleResults(self, results, fromPoller=True):
         try:
             arenaUniqueID = results.get('arenaUniqueID')
-            common = results.get('common', {})
 
-            if arenaUniqueID not in self.arenaUniqueIDs:
+            if arenaUniqueID not in self.poller and not fromPoller:
                 print_debug("[BattleResultsProvider] Unknown arenaUniqueID: {}".format(arenaUniqueID))
                 return
 
-            while arenaUniqueID in self.arenaUniqueIDs:
-                self.arenaUniqueIDs.remove(arenaUniqueID)
+            self.poller.remove(arenaUniqueID)
 
-            guiType = common.get('guiType', None)
-            print_debug("[BattleResultsProvider] guiType: {}".format(guiType))
-            if guiType != 1:
-                print_debug("[BattleResultsProvider] Unsupported game mode (guiType: {}), skipping".format(guiType))
+            accountDBID, historyRows = self.applyBattleResults(results)
+            if accountDBID is None:
                 return
 
-            personal = results.get('personal', {})
-            if 'avatar' in personal:
-                personal = personal['avatar']
-            personal_accountDBID = personal.get('accountDBID', 0)
-
-            vehicles_data = results.get('vehicles', {})
-            players = results.get('players', {})
-            duration = common.get('duration', 0)
-            winner_team = common.get('winnerTeam', 0)
-            player_team = personal.get('team', 0)
-
-            if winner_team == 0:
-                battle_result = 2
-            elif winner_team == player_team:
-                battle_result = 1
+            if self.sendResults(accountDBID, [arenaUniqueID], historyRows):
+                print_debug("[BattleResultsProvider] Battle stats sent successfully for PlayerID: {}".format(accountDBID))
             else:
-                battle_result = 0
+                print_debug("[BattleResultsProvider] Failed to send stats for PlayerID: {}, keeping battle".format(accountDBID))
+
+        except Exception as e:
+            print_error("[BattleResultsProvider] Error processing results: {}".format(e))
+
+    def applyBattleResults(self, results, live=True):
+        arenaUniqueID = results.get('arenaUniqueID')
+        common = results.get('common', {})
+        guiType = common.get('guiType', None)
+        print_debug("[BattleResultsProvider] guiType: {}".format(guiType))
+        if guiType != 1:
+            print_debug("[BattleResultsProvider] Unsupported game mode (guiType: {}), skipping".format(guiType))
+            return None, []
+
+        personal = results.get('personal', {})
+        if 'avatar' in personal:
+            personal = personal['avatar']
+        personal_accountDBID = personal.get('accountDBID', 0)
+
+        players = results.get('players', {})
+        duration = common.get('duration', 0)
+        winner_team = common.get('winnerTeam', 0)
+        player_team = personal.get('team', 0)
+
+        if winner_team == 0:
+            battle_result = 2
+        elif winner_team == player_team:
+            battle_result = 1
+        else:
+            battle_result = 0
+
+        print_debug("[BattleResultsProvider] Processing results for ArenaID: {}, Duration: {}, PlayerTeam: {}, WinnerTeam: {}, Result: {}".format(
+            arenaUniqueID, duration, player_team, winner_team, battle_result
+        ))
+
+        rows = self.indexVehicleRows(results.get('vehicles', {}))
+        own = rows.get(personal_accountDBID)
+        if own is None:
+            print_debug("[BattleResultsProvider] No vehicle row for PlayerID: {}".format(personal_accountDBID))
+            return None, []
+
+        battle = g_statsWrapper.get_battle_record(arenaUniqueID)
+        if battle is None:
+            # Backfilled battles were never tracked live in this session.
+            g_statsWrapper.create_battle(arenaUniqueID, start_time=common.get('arenaCreateTime', 0),
+                                         duration=duration, win=battle_result, map_name=self.getMapName(common))
+            battle = g_statsWrapper.get_battle_record(arenaUniqueID)
+        map_name = battle.map_name if battle else None
+        start_time = battle.start_time if battle else common.get('arenaCreateTime', 0)
+        members = self.getPlatoonAccountIDs(rows, players, personal_accountDBID, live)
+        historyRows = []
+
+        for accountDBID in [personal_accountDBID] + members:
+            vehicleID, vehicle = rows[accountDBID]
+            vehicle_type = g_nameCatalog.getVehicle(vehicle.get('typeCompDescr', 0))
+            damage = vehicle.get('damageDealt', 0)
+            kills = vehicle.get('kills', 0)
+            points = g_scoring.score_result(vehicle, tier=vehicle_type.tier or None)
+            vehicle_name = vehicle_type.shortName
+            player_name = players.get(accountDBID, {}).get('realName', 'Unknown')
+
+            if accountDBID == personal_accountDBID:
+                delta = g_statsWrapper.reconcile_events(arenaUniqueID, vehicleID, damage, kills)
+                if delta and any(delta):
+                    print_debug("[BattleResultsProvider] Live log differs from results for ArenaID: {} (damage: {}, kills: {})".format(
+                        arenaUniqueID, delta[0], delta[1]
+                    ))
 
-            print_debug("[BattleResultsProvider] Processing results for ArenaID: {}, Duration: {}, PlayerTeam: {}, WinnerTeam: {}, Result: {}".format(
-                arenaUniqueID, duration, player_team, winner_team, battle_result
+            if g_statsWrapper.get_player_battle_stats(arenaUniqueID, accountDBID) is None:
+                g_statsWrapper.add_player_to_battle(arena_id=arenaUniqueID, player_id=accountDBID, name=player_name)
+
+            g_statsWrapper.update_battle_stats(
+                arena_id=arenaUniqueID, player_id=accountDBID, name=player_name, points=points,
+                damage=damage, kills=kills, vehicle=vehicle_name,
+                win=battle_result, duration=duration
+            )
+
+            historyRows.append(dict(
+                arena_id=arenaUniqueID, account_id=accountDBID, player_name=player_name,
+                vehicle=vehicle_name, map_name=map_name, start_time=start_time,
+                duration=duration, win=battle_result, damage=damage, kills=kills, points=points
             ))
 
-            for vehicleID, vehicle_info in vehicles_data.items():
-                if not vehicle_info:
-                    continue
-
-                if isinstance(vehicle_info, list):
-                    vehicle = vehicle_info[0] if vehicle_info else None
-                else:
-                    vehicle = vehicle_info
-
-                if not vehicle:
-                    continue
-
-                accountDBID = vehicle.get('accountDBID', 0)
-                if accountDBID != personal_accountDBID:
-                    continue
-
-                vehicle_type = vehicles.getVehicleType(vehicle.get('typeCompDescr', 0))
-                damage = vehicle.get('damageDealt', 0)
-                kills = vehicle.get('kills', 0)
-                points = damage + (kills * g_statsWrapper.pointPerFrag)
-                vehicle_name = vehicle_type.shortUserString
-                player_name = players.get(accountDBID, {}).get('realName', 'Unknown')
-
-                g_statsWrapper.update_battle_stats(
-                    arena_id=arenaUniqueID, player_id=accountDBID, points=points,
-                    damage=damage, kills=kills, vehicle=vehicle_name,
-                    win=battle_result, duration=duration
-                )
-
-            result = g_serverManager.send_stats(player_id=accountDBID)
-            if result:
-                g_statsWrapper.clear_current_battle_data(arena_id=arenaUniqueID)
-                print_debug("[BattleResultsProvider] Battle stats sent successfully for PlayerID: {}".format(accountDBID))
+        if members:
+            print_debug("[BattleResultsProvider] Extracted results for {} platoon member(s) in ArenaID: {}".format(
+                len(members), arenaUniqueID
+            ))
+
+        return personal_accountDBID, historyRows
+
+    def sendResults(self, accountDBID, arenaUniqueIDs, historyRows):
+        # History is what the backfill dedupes against, so it is written only
+        # once the server acknowledges the battles. A battle whose send is not
+        # queued stays in memory; one the server rejects goes to the spill.
+        battles = [(arenaUniqueID, g_statsWrapper.get_battle(arenaUniqueID)) for arenaUniqueID in arenaUniqueIDs]
+        result = g_serverManager.send_stats(player_id=accountDBID, priority=PRIORITY_HIGH,
+                                            on_ack=self._resultsAck(battles, historyRows))
+        if not result or not result.get('success'):
+            return False
+        for arenaUniqueID in arenaUniqueIDs:
+            g_statsWrapper.clear_current_battle_data(arena_id=arenaUniqueID)
+        return True
+
+    def _resultsAck(self, battles, historyRows):
+        settled = set()
+
+        def callback(success):
+            # Called once per room; each outcome is applied only once.
+            if success in settled:
+                return
+            settled.add(success)
+            if success:
+                for row in historyRows:
+                    g_historyStore.record_battle(**row)
             else:
-                print_debug("[BattleResultsProvider] Failed to send stats for PlayerID: {}".format(accountDBID))
+                print_debug("[BattleResultsProvider] Server did not confirm {} battle(s), spilling".format(len(battles)))
+                g_statsWrapper.restore_spilled_battles(
+                    [{'arenaId': arenaUniqueID, 'battle': battle} for arenaUniqueID, battle in battles if battle])
+        return callback
 
-        except Exception as e:
-            print_error("[BattleResultsProvider] Error processing results: {}".format(e))
+    def processBackfill(self, resultsList):
+        # Every applied battle is held in memory until it is sent, so chunks
+        # stay within the retention cap; otherwise enforce_retention would
+        # evict backfilled (or live) battles before the send.
+        free = g_statsWrapper.battleRetention.max_entries - len(g_statsWrapper.get_all_battles())
+        chunkSize = max(1, free)
+        for start in range(0, len(resultsList), chunkSize):
+            # Unsent chunks are not in history, so the next backfill retries them.
+            if not self.sendBackfillChunk(resultsList[start:start + chunkSize]):
+                break
+
+    def sendBackfillChunk(self, resultsList):
+        applied = []
+        historyRows = []
+        accountDBID = None
+        for results in resultsList:
+            try:
+                applied_accountDBID, rows = self.applyBattleResults(results, live=False)
+            except Exception as e:
+                print_error("[BattleResultsProvider] Error applying backfilled results: {}".format(e))
+                continue
+            if applied_accountDBID is not None:
+                accountDBID = applied_accountDBID
+                applied.append(results.get('arenaUniqueID'))
+                historyRows.extend(rows)
+        if not applied:
+            return True
+
+        if self.sendResults(accountDBID, applied, historyRows):
+            print_debug("[BattleResultsProvider] Backfilled {} battle(s) for PlayerID: {}".format(len(applied), accountDBID))
+            return True
+        print_debug("[BattleResultsProvider] Failed to send backfilled battles for PlayerID: {}".format(accountDBID))
+        return False
+
+    def getMapName(self, common):
+        try:
+            import ArenaType
+            return g_nameCatalog.getMapName(ArenaType.g_cache[common.get('arenaTypeID')].geometryName)
+        except Exception:
+            return u"Unknown Map"
+
+    def indexVehicleRows(self, vehicles_data):
+        rows = {}
+        for vehicleID, vehicle_info in vehicles_data.items():
+            if isinstance(vehicle_info, list):
+                vehicle = vehicle_info[0] if vehicle_info else None
+            else:
+                vehicle = vehicle_info
+            if not vehicle:
+                continue
+            accountDBID = vehicle.get('accountDBID', 0)
+            if accountDBID:
+                rows[accountDBID] = (vehicleID, vehicle)
+        return rows
+
+    def getPlatoonAccountIDs(self, rows, players, personal_accountDBID, live=True):
+        # The hangar platoon may have changed since the battle started, so the
+        # prebattleID recorded in the results is checked as well.
+        memberIDs = set()
+        if live and self.platoonProvider is not None:
+            memberIDs.update(self.platoonProvider.getMemberAccountIDs())
+        own = players.get(personal_accountDBID, {})
+        prebattleID = own.get('prebattleID', 0)
+        if prebattleID:
+            for accountDBID, player in players.items():
+                if player.get('prebattleID', 0) == prebattleID and player.get('team', 0) == own.get('team', 0):
+                    memberIDs.add(accountDBID)
+        memberIDs.discard(personal_accountDBID)
+        return sorted(accountDBID for accountDBID in memberIDs if accountDBID in rows)
 
     def fini(self):
         g_playerEvents.onBattleResultsReceived -= self.onBattleResultsReceived
-        self.arenaUniqueIDs = []
+        g_playerEvents.onAccountShowGUI -= self.onAccountShowGUI
+        self.backfill.cancel()
+        self.poller.flushJournal()
+        self.poller.clear()
         print_debug("[BattleResultsProvider] Finalized")
@@ -5,7 +5,8 @@ from helpers import dependency
 from skeletons.gui.shared.utils import IHangarSpace
 from CurrentVehicle import g_currentVehicle
 
-from ..utils import print_error, print_debug, g_statsWrapper
+from ..utils import print_error, print_debug
+from .player_publisher import g_playerIdentity, g_playerInfoPublisher
 
 class HangarProvider(object):
 
@@ -13,11 +14,10 @@ class HangarProvider(object):
 
     def __init__(self):
         self.isInHangar = False
-        self.account_id = None
-        self.account_name = None
 
         self.currentVehicleName = None
         g_playerEvents.onAccountShowGUI += self.onAccountShowGUI
+        g_playerEvents.onEnqueued += self.onEnqueued
         self.hangarSpace.onSpaceCreate += self.onHangarSpaceCreate
         self.hangarSpace.onSpaceDestroy += self.onHangarSpaceDestroy
 
@@ -35,26 +35,32 @@ class HangarProvider(object):
         print_debug("[HangarProvider] Account GUI shown")
         player = BigWorld.player()
         if player:
-            self.account_id = getattr(player, 'databaseID', None)
-            self.account_name = getattr(player, 'name', None)
+            g_playerIdentity.refresh()
+            self.prewarmConnection()
             BigWorld.callback(5.0, self.onSendPlayerInfo)
         else:
             print_debug("[HangarProvider] Player not found")
             BigWorld.callback(1, self.onAccountShowGUI)
 
-    def onSendPlayerInfo(self):
+    def prewarmConnection(self):
         try:
             from ..server import g_serverManager
-            print_debug("[HangarProvider] Sending player info to server for account ID: {}".format(self.account_id))
-            g_statsWrapper.add_player_info(player_id=self.account_id, player_name=self.account_name)
-
-            result = g_serverManager.send_stats(player_id=self.account_id)
-            if result:
-                print_debug("[HangarProvider] Player info sent successfully for account ID: {}".format(self.account_id))
+            accountID, _ = g_playerIdentity.get()
+            if g_serverManager.prewarm(player_id=accountID):
+                print_debug("[HangarProvider] Connection prewarm started for account ID: {}".format(accountID))
+        except Exception as e:
+            print_error("[HangarProvider] Error prewarming connection: {}".format(e))
 
+    def onEnqueued(self, *args):
+        print_debug("[HangarProvider] Enqueued for battle")
+        self.prewarmConnection()
 
-        except ImportError:
-            print_debug("[HangarProvider] Config not available, using default API key")
+    def onSendPlayerInfo(self):
+        try:
+            if g_playerInfoPublisher.publish('hangar'):
+                print_debug("[HangarProvider] Player info sent for account ID: {}".format(g_playerIdentity.accountID))
+        except Exception as e:
+            print_error("[HangarProvider] Error sending player info: {}".format(e))
 
     def onHangarSpaceCreate(self, *args):
         self.isInHangar = True
@@ -78,5 +84,6 @@ class HangarProvider(object):
         
     def fini(self):
         g_playerEvents.onAccountShowGUI -= self.onAccountShowGUI
+        g_playerEvents.onEnqueued -= self.onEnqueued
         self.hangarSpace.onSpaceCreate -= self.onHangarSpaceCreate
         self.hangarSpace.onSpaceDestroy -= self.onHangarSpaceDestroy
\ No newline at end of file
@@ -0,0 +1,84 @@
+import time
+import BigWorld
+
+from ..utils import print_error, print_debug, g_statsWrapper
+from ..utils.event_log import EVENT_DAMAGE, EVENT_KILL
+
+
+class LiveUpdateTicker(object):
+    def __init__(self, onFlush=None, interval=0.25):
+        self.onFlush = onFlush
+        self.interval = interval
+        self.arenaUniqueID = None
+        self.playerID = None
+        self.vehicleTier = None
+        self.pending = []
+        self.callbackID = None
+        self.flushCount = 0
+
+    def start(self, arenaUniqueID, playerID, vehicleTier=None, interval=None):
+        self.stop(flush=False)
+        self.arenaUniqueID = arenaUniqueID
+        self.playerID = playerID
+        self.vehicleTier = vehicleTier
+        if interval:
+            self.interval = interval
+        self.pending = []
+        self._schedule()
+
+    def stop(self, flush=True):
+        if flush:
+            self.flush()
+        if self.callbackID is not None:
+            try:
+                BigWorld.cancelCallback(self.callbackID)
+            except Exception:
+                pass
+            self.callbackID = None
+
+    def addDamage(self, attackerID, targetID, damage):
+        self.pending.append((EVENT_DAMAGE, attackerID, targetID, damage, time.time()))
+
+    def addKill(self, attackerID, targetID, force=True):
+        self.pending.append((EVENT_KILL, attackerID, targetID, 0, time.time()))
+        if force:
+            self.flush()
+
+    def _schedule(self):
+        self.callbackID = BigWorld.callback(self.interval, self._tick)
+
+    def _tick(self):
+        self.callbackID = None
+        try:
+            self.flush()
+        finally:
+            if self.arenaUniqueID is not None:
+                self._schedule()
+
+    def flush(self):
+        if not self.pending:
+            return False
+        events, self.pending = self.pending, []
+        try:
+            for eventType, attackerID, targetID, damage, timestamp in events:
+                if eventType == EVENT_DAMAGE:
+                    g_statsWrapper.record_damage(self.arenaUniqueID, self.playerID, attackerID, targetID, damage,
+                                                 timestamp=timestamp, tier=self.vehicleTier)
+                else:
+                    g_statsWrapper.record_kill(self.arenaUniqueID, self.playerID, attackerID, targetID,
+                                               timestamp=timestamp, tier=self.vehicleTier)
+            self.flushCount += 1
+            if self.onFlush is not None:
+                self.onFlush(len(events))
+            return True
+        except Exception as e:
+            print_error("[LiveUpdateTicker] Error flushing {} event(s): {}".format(len(events), e))
+            return False
+
+    def reset(self):
+        self.stop(flush=False)
+        self.arenaUniqueID = None
+        self.playerID = None
+        self.pending = []
+        print_debug("[LiveUpdateTicker] Reset after {} flush(es)".format(self.flushCount))
+        self.flushCount = 0
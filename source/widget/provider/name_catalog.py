@@ -0,0 +1,143 @@
+import json
+import os
+import threading
+from collections import namedtuple
+
+import BigWorld
+from helpers import getClientLanguage, getClientVersion
+from helpers.i18n import makeString
+from items import vehicles
+
+from ..utils import print_error, print_debug
+
+NAME_CATALOG_PATH = os.path.join('mods', 'configs', 'under_pressure', 'widget_names.json')
+SAVE_DELAY = 10.0
+
+VehicleName = namedtuple('VehicleName', ('shortName', 'name', 'tier', 'vehicleClass'))
+
+UNKNOWN_VEHICLE = VehicleName(u"Unknown Vehicle", u"Unknown Vehicle", 0, u'')
+
+
+class NameCatalog(object):
+    def __init__(self, path=NAME_CATALOG_PATH):
+        self.path = path
+        self.vehicles = {}
+        self.maps = {}
+        self.loaded = False
+        self.dirty = False
+        self.saveCallbackID = None
+        self._lock = threading.Lock()
+
+    def _cacheKey(self):
+        try:
+            return str(getClientVersion()), str(getClientLanguage())
+        except Exception:
+            return None, None
+
+    def load(self):
+        self.loaded = True
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            # Names change with patches and with the client language, so a
+            # catalog saved for another version or language is discarded.
+            if [data.get('version'), data.get('language')] != list(self._cacheKey()):
+                print_debug("[NameCatalog] Cached names are for another client version or language, rebuilding")
+                return False
+            for compactDescr, entry in (data.get('vehicles') or {}).items():
+                self.vehicles[int(compactDescr)] = VehicleName(*entry)
+            self.maps.update(data.get('maps') or {})
+            print_debug("[NameCatalog] Loaded {} vehicles and {} maps".format(len(self.vehicles), len(self.maps)))
+            return True
+        except Exception as e:
+            print_error("[NameCatalog] Error loading {}: {}".format(self.path, e))
+            return False
+
+    def _resolveVehicle(self, compactDescr):
+        vehicleType = vehicles.getVehicleType(compactDescr)
+        try:
+            vehicleClass = vehicles.getVehicleClassFromVehicleType(vehicleType)
+        except Exception:
+            vehicleClass = u''
+        return VehicleName(vehicleType.shortUserString, vehicleType.userString,
+                           getattr(vehicleType, 'level', 0), vehicleClass or u'')
+
+    def getVehicle(self, compactDescr):
+        if not self.loaded:
+            self.load()
+        entry = self.vehicles.get(compactDescr)
+        if entry is None:
+            try:
+                entry = self._resolveVehicle(compactDescr)
+            except Exception as e:
+                print_debug("[NameCatalog] Unknown vehicle {}: {}".format(compactDescr, e))
+                return UNKNOWN_VEHICLE
+            self.vehicles[compactDescr] = entry
+            self._markDirty()
+        return entry
+
+    def getMapName(self, geometryName):
+        if not self.loaded:
+            self.load()
+        name = self.maps.get(geometryName)
+        if name is None:
+            name = makeString('#arenas:%s/name' % geometryName)
+            self.maps[geometryName] = name
+            self._markDirty()
+        return name
+
+    def _markDirty(self):
+        self.dirty = True
+        if self.saveCallbackID is None:
+            self.saveCallbackID = BigWorld.callback(SAVE_DELAY, self._onSaveCallback)
+
+    def _onSaveCallback(self):
+        self.saveCallbackID = None
+        self.save(background=True)
+
+    def save(self, background=False):
+        if not self.dirty:
+            return
+        self.dirty = False
+        version, language = self._cacheKey()
+        data = {
+            'version': version,
+            'language': language,
+            'vehicles': dict((str(compactDescr), list(entry)) for compactDescr, entry in self.vehicles.items()),
+            'maps': dict(self.maps)
+        }
+        if background:
+            worker = threading.Thread(target=self._write, args=(data,))
+            worker.daemon = True
+            worker.start()
+        else:
+            self._write(data)
+
+    def _write(self, data):
+        with self._lock:
+            try:
+                directory = os.path.dirname(self.path)
+                if directory and not os.path.exists(directory):
+                    os.makedirs(directory)
+                tmpPath = self.path + '.tmp'
+                with open(tmpPath, 'w') as f:
+                    json.dump(data, f, separators=(',', ':'))
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                os.rename(tmpPath, self.path)
+            except Exception as e:
+                print_error("[NameCatalog] Error saving {}: {}".format(self.path, e))
+
+    def fini(self):
+        if self.saveCallbackID is not None:
+            try:
+                BigWorld.cancelCallback(self.saveCallbackID)
+            except Exception:
+                pass
+            self.saveCallbackID = None
+        self.save()
+
+
+g_nameCatalog = NameCatalog()
@@ -1,11 +1,16 @@
+import time
 import BigWorld
 from PlayerEvents import g_playerEvents
 from helpers import dependency
 from skeletons.gui.game_control import IPlatoonController
-from items import vehicles as vehiclesUtils
 from skeletons.gui.shared.utils import IHangarSpace
 
 from ..utils import print_error, print_debug, g_statsWrapper
+from .name_catalog import g_nameCatalog
+from .player_publisher import g_playerIdentity, g_playerInfoPublisher
+
+UPDATE_DELAY = 1.0
+UPDATE_MAX_DELAY = 3.0
 
 class PlatoonProvider():
 
@@ -18,6 +23,9 @@ class PlatoonProvider():
         self.maxSlotCount = 0
         self.platoonMembers = []
         self.commanderID = None
+        self.updateCallbackID = None
+        self.firstEventAt = None
+        self.hasState = False
 
 
         self.hangarSpace.onSpaceCreate += self.onHangarSpaceCreate
@@ -32,31 +40,41 @@ class PlatoonProvider():
 
     def onHangarSpaceCreate(self, *args):
         print_debug("[PlatoonProvider] Hangar space created")
-        BigWorld.callback(1.0, self.updatePlatoonInfo)
+        self.scheduleUpdate()
 
     def onPlatoonUpdated(self, *args):
         print_debug("[PlatoonProvider] Platoon updated")
-        BigWorld.callback(1.0, self.updatePlatoonInfo)
+        self.scheduleUpdate()
+
+    def scheduleUpdate(self):
+        # The controller fires several events for one platoon change; each one
+        # re-arms the timer so the update runs once the burst has settled,
+        # but never later than UPDATE_MAX_DELAY after the first event.
+        now = time.time()
+        if self.updateCallbackID is not None:
+            if now - self.firstEventAt >= UPDATE_MAX_DELAY - UPDATE_DELAY:
+                return
+            BigWorld.cancelCallback(self.updateCallbackID)
+        else:
+            self.firstEventAt = now
+        self.updateCallbackID = BigWorld.callback(UPDATE_DELAY, self.onUpdateCallback)
+
+    def onUpdateCallback(self):
+        self.updateCallbackID = None
+        self.firstEventAt = None
+        self.updatePlatoonInfo()
 
 
     def onSendPlayerInfo(self):
         try:
-            from ..server import g_serverManager
-
-            player = BigWorld.player()
-            if player:
-                account_id = getattr(player, 'databaseID', None)
-                account_name = getattr(player, 'name', None)
-
-            print_debug("[PlatoonProvider] Sending player info to server for account ID: {}".format(account_id))
-            
-            g_statsWrapper.add_player_info(player_id=account_id, player_name=account_name)
-            result =  g_serverManager.send_stats(player_id=account_id)
-            if result:
-                print_debug("[PlatoonProvider] Player info sent successfully for account ID: {}".format(account_id))
-
-        except ImportError:
-            print_debug("[PlatoonProvider] Config not available, using default API key")
+            # Platoon mates are added to PlayerInfo next to the player. Only
+            # changed entries are re-encoded, but the protocol has no delta,
+            # so the send still carries the full PlayerInfo and BattleStats.
+            members = [member for member in self.platoonMembers if member is not None]
+            if g_playerInfoPublisher.publish('platoon', members):
+                print_debug("[PlatoonProvider] Player info sent for account ID: {}".format(g_playerIdentity.accountID))
+        except Exception as e:
+            print_error("[PlatoonProvider] Error sending player info: {}".format(e))
 
 
     def updatePlatoonInfo(self):
@@ -70,31 +88,58 @@ class PlatoonProvider():
             return
         try:
             print_debug("[PlatoonProvider] updatePlatoonInfo called")
-            self.onSendPlayerInfo()
-            self.isInPlatoon = self.platoon.isInPlatoon()
+            isInPlatoon = self.platoon.isInPlatoon()
             self.maxSlotCount = self.platoon.getMaxSlotCount()
 
-            self.platoonMembers = []
-            self.commanderID = None
+            members = []
+            commanderID = None
             
             slots = self.platoon.getPlatoonSlotsData()
 
             for slot in slots:
                 player = slot.get('player')
                 if player is None:
-                    self.platoonMembers.append(None)
+                    members.append(None)
                     continue
                 if player.get('isCommander'):
-                    self.commanderID = player.get('accountDBID')
+                    commanderID = player.get('accountDBID')
 
                 vehicleDescr = slot.get('selectedVehicle')
-                vehicle = vehiclesUtils.getItemByCompactDescr(vehicleDescr.get('intCD')) if vehicleDescr else None
-                self.platoonMembers.append((player.get('accountDBID'), player.get('name'), vehicle))
+                vehicle = g_nameCatalog.getVehicle(vehicleDescr.get('intCD')) if vehicleDescr else None
+                members.append((player.get('accountDBID'), player.get('name'), vehicle))
+
+            previous = dict((member[0], member) for member in self.platoonMembers if member is not None)
+            current = dict((member[0], member) for member in members if member is not None)
+            changedMembers = [member for accountDBID, member in current.items() if previous.get(accountDBID) != member]
+            changed = (not self.hasState or bool(changedMembers) or set(previous) != set(current)
+                       or commanderID != self.commanderID or isInPlatoon != self.isInPlatoon)
+
+            ownID, _ = g_playerIdentity.get()
+            for accountDBID in set(previous) - set(current):
+                if accountDBID and accountDBID != ownID:
+                    g_statsWrapper.remove_player_info(accountDBID)
+
+            self.isInPlatoon = isInPlatoon
+            self.platoonMembers = members
+            self.commanderID = commanderID
+            self.hasState = True
+
+            if not changed:
+                print_debug("[PlatoonProvider] Platoon unchanged, skipping send")
+                return
+            print_debug("[PlatoonProvider] Platoon changed ({} member update(s))".format(len(changedMembers)))
+            self.onSendPlayerInfo()
         except Exception as e:
             print_error("[PlatoonProvider] Error updating platoon info: {}".format(e))
 
 
+    def getMemberAccountIDs(self):
+        return [member[0] for member in self.platoonMembers if member is not None and member[0]]
+
     def fini(self):
+        if self.updateCallbackID is not None:
+            BigWorld.cancelCallback(self.updateCallbackID)
+            self.updateCallbackID = None
         self.hangarSpace.onSpaceCreate -= self.onHangarSpaceCreate
 
         self.platoon.onMembersUpdate -= self.onPlatoonUpdated
@@ -0,0 +1,129 @@
+import hashlib
+import time
+import BigWorld
+
+from ..server import g_serverManager
+from ..utils import print_error, print_debug, g_metrics, g_statsWrapper
+from ..utils.stats_records import encode_json
+
+PENDING_TIMEOUT = 30.0
+ACKED_TTL = 300.0
+
+_published = g_metrics.counter('player_info.published')
+_deduped = g_metrics.counter('player_info.deduped')
+
+
+class PlayerIdentity(object):
+    def __init__(self):
+        self.accountID = None
+        self.name = None
+
+    def refresh(self):
+        # In battle BigWorld.player() is the avatar, which has no databaseID,
+        # so values seen in the hangar are kept rather than cleared.
+        try:
+            player = BigWorld.player()
+        except Exception:
+            player = None
+        if player:
+            accountID = getattr(player, 'databaseID', None)
+            name = getattr(player, 'name', None)
+            if accountID:
+                self.accountID = accountID
+            if name:
+                self.name = name
+        return self.accountID, self.name
+
+    def get(self):
+        if not self.accountID or not self.name:
+            self.refresh()
+        return self.accountID, self.name
+
+    def reset(self):
+        self.accountID = None
+        self.name = None
+
+
+class PlayerInfoPublisher(object):
+    def __init__(self, identity):
+        self.identity = identity
+        self.ackedHashes = {}
+        self.pending = {}
+
+    def contentHash(self, entries):
+        try:
+            from ..settings import g_config
+            keys = sorted(g_config.get_api_keys())
+        except Exception:
+            keys = []
+        state = [keys, sorted([int(accountID), name, list(vehicle) if vehicle else None]
+                              for accountID, name, vehicle in entries)]
+        return hashlib.sha1(encode_json(state).encode('utf-8')).hexdigest()
+
+    def publish(self, source, members=()):
+        accountID, name = self.identity.get()
+        if not accountID or not name:
+            print_debug("[PlayerInfoPublisher] Player identity not available yet")
+            return False
+
+        # members: (accountID, name, vehicle) tuples; the vehicle only feeds
+        # the hash, so a mate switching tanks still counts as a change.
+        entries = [(accountID, name, None)]
+        entries.extend(member for member in members if member[0] and member[1])
+        digest = self.contentHash(entries)
+
+        # Entries are re-added even when the send is skipped, so one evicted
+        # by retention comes back and the rest stay fresh.
+        try:
+            for entryID, entryName, _ in entries:
+                g_statsWrapper.add_player_info(player_id=entryID, player_name=entryName)
+        except Exception as e:
+            print_error("[PlayerInfoPublisher] Error updating player info: {}".format(e))
+            return False
+
+        # Acked content is only trusted for a while, and a send that was never
+        # acknowledged blocks identical sends for less, so the server state
+        # heals even if it was lost on its side.
+        now = time.time()
+        acked = self.ackedHashes.get(source)
+        pending = self.pending.get(source)
+        if (acked is not None and acked[0] == digest and now - acked[1] < ACKED_TTL) or (
+                pending is not None and pending[0] == digest and now - pending[1] < PENDING_TIMEOUT):
+            _deduped.inc()
+            print_debug("[PlayerInfoPublisher] {} player info unchanged, skipping send".format(source))
+            return False
+
+        try:
+            self.pending[source] = (digest, now)
+            result = g_serverManager.send_stats(player_id=accountID, on_ack=self._ackCallback(source, digest))
+        except Exception as e:
+            print_error("[PlayerInfoPublisher] Error sending player info: {}".format(e))
+            self.pending.pop(source, None)
+            return False
+
+        if not result or not result.get('success'):
+            self.pending.pop(source, None)
+            return False
+        _published.inc()
+        print_debug("[PlayerInfoPublisher] {} player info queued for account ID: {}".format(source, accountID))
+        return True
+
+    def _ackCallback(self, source, digest):
+        def callback(success):
+            pending = self.pending.get(source)
+            if pending is not None and pending[0] == digest:
+                self.pending.pop(source, None)
+            if success:
+                self.ackedHashes[source] = (digest, time.time())
+        return callback
+
+    def reset(self):
+        self.ackedHashes = {}
+        self.pending = {}
+
+
+g_playerIdentity = PlayerIdentity()
+g_playerInfoPublisher = PlayerInfoPublisher(g_playerIdentity)
+
+# A new connection or rejoined room may have lost what was sent before.
+g_serverManager.add_connect_listener(g_playerInfoPublisher.reset)
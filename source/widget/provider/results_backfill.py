@@ -0,0 +1,252 @@
+import base64
+import json
+import os
+import threading
+import time
+import BigWorld
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from ..history import g_historyStore
+from ..utils import print_error, print_debug, g_metrics
+
+BACKFILL_WATERMARK_PATH = os.path.join('mods', 'configs', 'under_pressure', 'widget_backfill.json')
+
+_fetched = g_metrics.counter('backfill.fetched')
+_skipped = g_metrics.counter('backfill.skipped')
+
+
+def getResultsCacheDir():
+    try:
+        from account_helpers import BattleResultsCache
+        return BattleResultsCache.CACHE_DIR
+    except Exception:
+        pass
+    preferences = BigWorld.wg_getPreferencesFilePath()
+    if isinstance(preferences, str):
+        preferences = preferences.decode('utf-8', 'ignore')
+    return os.path.join(os.path.dirname(preferences), u'battle_results')
+
+
+def loadWatermark(path):
+    # Battles cached before the backfill was installed were uploaded live but
+    # are not in the new history, so the first run records its start time
+    # and nothing older is ever backfilled.
+    try:
+        with open(path, 'r') as f:
+            return float(json.load(f)['installedAt'])
+    except Exception:
+        pass
+    installedAt = time.time()
+    try:
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(path, 'w') as f:
+            json.dump({'installedAt': installedAt}, f)
+    except Exception as e:
+        print_error("[ResultsBackfill] Error writing {}: {}".format(path, e))
+    return installedAt
+
+
+def scanResultsCache(cacheDir, accountName, since, limit):
+    # Cached results live in <cacheDir>/<base32("name;clientVersion")>/<arenaUniqueID>.dat
+    found = []
+    if not cacheDir or not os.path.isdir(cacheDir):
+        return found
+    for folder in os.listdir(cacheDir):
+        try:
+            owner = base64.b32decode(folder).split(';')[0]
+        except Exception:
+            continue
+        if accountName and owner != accountName:
+            continue
+        folderPath = os.path.join(cacheDir, folder)
+        if not os.path.isdir(folderPath):
+            continue
+        for fileName in os.listdir(folderPath):
+            stem, ext = os.path.splitext(fileName)
+            if ext != '.dat' or not stem.isdigit():
+                continue
+            try:
+                modified = os.path.getmtime(os.path.join(folderPath, fileName))
+            except OSError:
+                continue
+            if modified >= since:
+                found.append((modified, int(stem)))
+    found.sort(reverse=True)
+    return [arenaUniqueID for _, arenaUniqueID in found[:limit]]
+
+
+def _knownArenaIDs(conn, accountDBID, arenaUniqueIDs):
+    known = set()
+    for start in range(0, len(arenaUniqueIDs), 100):
+        chunk = arenaUniqueIDs[start:start + 100]
+        rows = conn.execute(
+            "SELECT arena_id FROM battles WHERE account_id = ? AND arena_id IN ({})".format(', '.join('?' * len(chunk))),
+            [int(accountDBID)] + [int(arenaUniqueID) for arenaUniqueID in chunk])
+        known.update(row[0] for row in rows)
+    return known
+
+
+class ResultsBackfill(object):
+    def __init__(self, onResults, isPending=None, maxConcurrent=2, requestInterval=1.0,
+                 requestTimeout=15.0, maxArenas=20, window=2 * 24 * 3600,
+                 watermarkPath=BACKFILL_WATERMARK_PATH):
+        self.onResults = onResults
+        self.isPending = isPending
+        self.maxConcurrent = maxConcurrent
+        self.requestInterval = requestInterval
+        self.requestTimeout = requestTimeout
+        self.maxArenas = maxArenas
+        self.window = window
+        self.watermarkPath = watermarkPath
+        self.completedAccounts = set()
+        self.accountDBID = None
+        self.queue = []
+        self.inFlight = {}
+        self.collected = []
+        self.callbackID = None
+        self.running = False
+        self.generation = 0
+        self.scanned = queue.Queue()
+
+    def start(self, accountDBID, accountName):
+        if self.running or not accountDBID or accountDBID in self.completedAccounts:
+            return False
+        self.running = True
+        self.generation += 1
+        self.accountDBID = accountDBID
+        self.queue = []
+        self.inFlight = {}
+        self.collected = []
+        generation = self.generation
+        since = time.time() - self.window
+
+        def scan():
+            try:
+                scanSince = max(since, loadWatermark(self.watermarkPath))
+                arenaUniqueIDs = scanResultsCache(getResultsCacheDir(), accountName, scanSince, self.maxArenas)
+            except Exception as e:
+                print_error("[ResultsBackfill] Error scanning results cache: {}".format(e))
+                arenaUniqueIDs = []
+            self.scanned.put((generation, arenaUniqueIDs))
+
+        worker = threading.Thread(target=scan)
+        worker.daemon = True
+        worker.start()
+        # BigWorld is not thread-safe, so the scan result is picked up by a
+        # poll on the game thread rather than scheduled from the worker.
+        self.callbackID = BigWorld.callback(self.requestInterval, self._pollScan)
+        return True
+
+    def cancel(self):
+        self.generation += 1
+        self.running = False
+        self.queue = []
+        self.inFlight = {}
+        self.collected = []
+        if self.callbackID is not None:
+            try:
+                BigWorld.cancelCallback(self.callbackID)
+            except Exception:
+                pass
+            self.callbackID = None
+
+    def _pollScan(self):
+        self.callbackID = None
+        while True:
+            try:
+                generation, arenaUniqueIDs = self.scanned.get_nowait()
+            except queue.Empty:
+                break
+            if generation == self.generation:
+                self._onScanned(generation, arenaUniqueIDs)
+                return
+        if self.running:
+            self.callbackID = BigWorld.callback(self.requestInterval, self._pollScan)
+
+    def _onScanned(self, generation, arenaUniqueIDs):
+        if generation != self.generation:
+            return
+        if self.isPending is not None:
+            arenaUniqueIDs = [arenaUniqueID for arenaUniqueID in arenaUniqueIDs if not self.isPending(arenaUniqueID)]
+        if not arenaUniqueIDs:
+            self._finish()
+            return
+        submitted = g_historyStore.submit_query(
+            _knownArenaIDs, lambda known: self._onKnown(generation, arenaUniqueIDs, known),
+            self.accountDBID, arenaUniqueIDs)
+        if not submitted:
+            self._onKnown(generation, arenaUniqueIDs, None)
+
+    def _onKnown(self, generation, arenaUniqueIDs, known):
+        if generation != self.generation:
+            return
+        # A failed history query must not re-upload every cached battle.
+        if known is None:
+            print_debug("[ResultsBackfill] History unavailable, skipping backfill")
+            self._finish()
+            return
+        self.queue = [arenaUniqueID for arenaUniqueID in arenaUniqueIDs if arenaUniqueID not in known]
+        _skipped.inc(len(arenaUniqueIDs) - len(self.queue))
+        print_debug("[ResultsBackfill] {} cached battle(s), {} missing from history".format(
+            len(arenaUniqueIDs), len(self.queue)))
+        self._pump()
+
+    def _pump(self):
+        self.callbackID = None
+        now = time.time()
+        for arenaUniqueID, requestedAt in list(self.inFlight.items()):
+            if now - requestedAt > self.requestTimeout:
+                del self.inFlight[arenaUniqueID]
+        if not self.queue and not self.inFlight:
+            self._finish()
+            return
+        # One request per interval and a cap on outstanding requests keep the
+        # cache reads spread out so the hangar never stalls on them.
+        if self.queue and len(self.inFlight) < self.maxConcurrent:
+            self._request(self.queue.pop(0), now)
+        self.callbackID = BigWorld.callback(self.requestInterval, self._pump)
+
+    def _request(self, arenaUniqueID, now):
+        try:
+            cache = BigWorld.player().battleResultsCache
+        except Exception:
+            print_debug("[ResultsBackfill] Results cache unavailable, stopping")
+            self.queue = []
+            return
+        generation = self.generation
+        self.inFlight[arenaUniqueID] = now
+
+        def resultCallback(code, results):
+            if generation != self.generation or self.inFlight.pop(arenaUniqueID, None) is None:
+                return
+            if code > 0 and results:
+                _fetched.inc()
+                self.collected.append(results)
+
+        try:
+            cache.get(arenaUniqueID, resultCallback)
+        except Exception as e:
+            self.inFlight.pop(arenaUniqueID, None)
+            print_debug("[ResultsBackfill] battleResultsCache error: {}".format(e))
+
+    def _finish(self):
+        collected, self.collected = self.collected, []
+        self.running = False
+        self.completedAccounts.add(self.accountDBID)
+        if self.callbackID is not None:
+            try:
+                BigWorld.cancelCallback(self.callbackID)
+            except Exception:
+                pass
+            self.callbackID = None
+        if collected:
+            try:
+                self.onResults(collected)
+            except Exception as e:
+                print_error("[ResultsBackfill] Error applying backfilled results: {}".format(e))
@@ -0,0 +1,245 @@
+import os
+import threading
+import time
+import BigWorld
+
+from ..utils import print_error, print_debug, g_metrics
+from ..utils.spool import Spool
+
+PENDING_ARENAS_PATH = os.path.join('mods', 'configs', 'under_pressure', 'widget_pending_arenas.jsonl')
+
+_polls = g_metrics.counter('results.polls')
+_expired = g_metrics.counter('results.expired')
+
+
+class PendingArena(object):
+    __slots__ = ('arenaUniqueID', 'addedAt', 'endedAt', 'nextPollAt', 'attempts', 'requestedAt')
+
+    def __init__(self, arenaUniqueID, addedAt, nextPollAt):
+        self.arenaUniqueID = arenaUniqueID
+        self.addedAt = addedAt
+        self.endedAt = None
+        self.nextPollAt = nextPollAt
+        self.attempts = 0
+        self.requestedAt = None
+
+
+class ResultsPoller(object):
+    def __init__(self, onResults, baseDelay=2.0, maxDelay=60.0, maxAge=2 * 3600,
+                 battleTimeout=20 * 60, requestTimeout=15.0, journalPath=None):
+        self.onResults = onResults
+        self.baseDelay = baseDelay
+        self.maxDelay = maxDelay
+        self.maxAge = maxAge
+        self.battleTimeout = battleTimeout
+        self.requestTimeout = requestTimeout
+        self.pending = {}
+        self.callbackID = None
+        self.nextTickAt = None
+        self.journal = Spool(journalPath, max_records=100, max_age=maxAge) if journalPath else None
+        self._journalLock = threading.Lock()
+        self._journalRecords = None
+        self._journalWriting = False
+
+    def __contains__(self, arenaUniqueID):
+        return arenaUniqueID in self.pending
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, arenaUniqueID, addedAt=None, ended=False, endedAt=None):
+        if not arenaUniqueID or arenaUniqueID in self.pending:
+            return False
+        now = time.time()
+        addedAt = addedAt or now
+        # Results cannot exist before the battle ends, so a battle in progress
+        # is only polled if its end is never reported (crash, relog).
+        entry = PendingArena(arenaUniqueID, addedAt, addedAt + self.battleTimeout)
+        self.pending[arenaUniqueID] = entry
+        if ended:
+            self.markEnded(arenaUniqueID, endedAt or addedAt)
+        else:
+            self.wake()
+            self._saveJournal()
+        return True
+
+    def markEnded(self, arenaUniqueID, endedAt=None):
+        entry = self.pending.get(arenaUniqueID)
+        if entry is None or entry.endedAt is not None:
+            return False
+        entry.endedAt = endedAt or time.time()
+        entry.attempts = 0
+        entry.nextPollAt = entry.endedAt + self.baseDelay
+        self.wake()
+        self._saveJournal()
+        return True
+
+    def remove(self, arenaUniqueID):
+        entry = self.pending.pop(arenaUniqueID, None)
+        if not self.pending:
+            self.stop()
+        if entry is not None:
+            self._saveJournal()
+        return entry is not None
+
+    def restore(self):
+        if self.journal is None:
+            return 0
+        try:
+            records = self.journal.load()
+        except Exception as e:
+            print_error("[ResultsPoller] Error reading pending arenas: {}".format(e))
+            return 0
+        restored = 0
+        for record in records:
+            arenaUniqueID = record.get('arenaUniqueID')
+            addedAt = record.get('addedAt')
+            # The client restarted, so a battle that never reported its end is
+            # over by now and can be polled straight away.
+            if self.add(arenaUniqueID, addedAt, ended=True, endedAt=record.get('endedAt') or addedAt):
+                restored += 1
+        if restored:
+            print_debug("[ResultsPoller] Restored {} pending arena(s)".format(restored))
+        return restored
+
+    def _journalSnapshot(self):
+        return [{
+            'arenaUniqueID': entry.arenaUniqueID,
+            'addedAt': entry.addedAt,
+            'endedAt': entry.endedAt,
+            'spooledAt': entry.endedAt or entry.addedAt
+        } for entry in self.pending.values()]
+
+    def _saveJournal(self):
+        if self.journal is None:
+            return
+        records = self._journalSnapshot()
+        with self._journalLock:
+            self._journalRecords = records
+            if self._journalWriting:
+                return
+            self._journalWriting = True
+        worker = threading.Thread(target=self._writeJournal)
+        worker.daemon = True
+        worker.start()
+
+    def _writeJournal(self):
+        # A single writer drains the latest snapshot, so bursts of changes
+        # collapse into one write and an older state never lands last.
+        while True:
+            with self._journalLock:
+                records, self._journalRecords = self._journalRecords, None
+                if records is None:
+                    self._journalWriting = False
+                    return
+            try:
+                self.journal.replace(records)
+            except Exception as e:
+                print_error("[ResultsPoller] Error writing pending arenas: {}".format(e))
+
+    def flushJournal(self):
+        if self.journal is None:
+            return
+        with self._journalLock:
+            self._journalRecords = None
+        try:
+            self.journal.replace(self._journalSnapshot())
+        except Exception as e:
+            print_error("[ResultsPoller] Error writing pending arenas: {}".format(e))
+
+    def wake(self):
+        self._schedule(force=True)
+
+    def stop(self):
+        if self.callbackID is not None:
+            try:
+                BigWorld.cancelCallback(self.callbackID)
+            except Exception:
+                pass
+        self.callbackID = None
+        self.nextTickAt = None
+
+    def clear(self):
+        self.stop()
+        self.pending = {}
+
+    def _schedule(self, force=False):
+        if not self.pending:
+            self.stop()
+            return
+        now = time.time()
+        dueAt = min(self._dueAt(entry) for entry in self.pending.values())
+        if self.callbackID is not None and not force and self.nextTickAt is not None and self.nextTickAt <= dueAt:
+            return
+        self.stop()
+        delay = min(max(dueAt - now, 0.1), self.maxDelay)
+        self.nextTickAt = now + delay
+        self.callbackID = BigWorld.callback(delay, self._tick)
+
+    def _dueAt(self, entry):
+        if entry.requestedAt is not None:
+            return entry.requestedAt + self.requestTimeout
+        return entry.nextPollAt
+
+    def _tick(self):
+        self.callbackID = None
+        self.nextTickAt = None
+        now = time.time()
+        try:
+            cache = BigWorld.player().battleResultsCache
+        except Exception:
+            cache = None
+        expired = False
+
+        for arenaUniqueID, entry in list(self.pending.items()):
+            if now - (entry.endedAt or entry.addedAt) > self.maxAge:
+                print_debug("[ResultsPoller] Giving up on ArenaID: {} after {} attempt(s)".format(arenaUniqueID, entry.attempts))
+                _expired.inc()
+                del self.pending[arenaUniqueID]
+                expired = True
+                continue
+            if entry.requestedAt is not None:
+                if now - entry.requestedAt < self.requestTimeout:
+                    continue
+                self._backoff(entry, now)
+            if entry.nextPollAt > now:
+                continue
+            if cache is None:
+                # No account entity (in battle or reconnecting): check again
+                # later without counting it as a failed attempt.
+                entry.nextPollAt = now + self.baseDelay * 2
+                continue
+            self._request(cache, entry, now)
+
+        if expired:
+            self._saveJournal()
+        self._schedule()
+
+    def _request(self, cache, entry, now):
+        arenaUniqueID = entry.arenaUniqueID
+        entry.requestedAt = now
+        _polls.inc()
+
+        def resultCallback(code, results):
+            current = self.pending.get(arenaUniqueID)
+            if current is not entry:
+                return
+            entry.requestedAt = None
+            if code > 0 and results:
+                del self.pending[arenaUniqueID]
+                self._saveJournal()
+                self.onResults(results)
+            else:
+                self._backoff(entry, time.time())
+            self._schedule()
+
+        try:
+            cache.get(arenaUniqueID, resultCallback)
+        except Exception as e:
+            print_debug("[ResultsPoller] battleResultsCache error: {}".format(e))
+            self._backoff(entry, now)
+
+    def _backoff(self, entry, now):
+        entry.requestedAt = None
+        entry.attempts += 1
+        entry.nextPollAt = now + min(self.maxDelay, self.baseDelay * (2 ** min(entry.attempts, 16)))
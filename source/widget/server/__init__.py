@@ -1,8 +1,13 @@
 import BigWorld
 from .server_manager import ServerManager
+from .room import PRIORITY_NORMAL, PRIORITY_HIGH
+from .shutdown import SHUTDOWN_TIMEOUT
 
 __all__ = [
     'g_serverManager',
+    'PRIORITY_NORMAL',
+    'PRIORITY_HIGH',
+    'SHUTDOWN_TIMEOUT',
 ]
 
 g_serverManager = ServerManager()
\ No newline at end of file
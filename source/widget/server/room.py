@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from collections import deque
+
+JOIN_NONE = 'none'
+JOIN_PENDING = 'pending'
+JOIN_JOINED = 'joined'
+
+PRIORITY_NORMAL = 0
+PRIORITY_HIGH = 1
+
+ACKED_EVENTS = ('updateStats',)
+
+MAX_IN_FLIGHT = 32
+IN_FLIGHT_TIMEOUT = 60.0
+
+
+class OutboundMessage(object):
+    __slots__ = ('event', 'data', 'seq', 'enqueued_at', 'sent_at', 'on_ack', 'priority', 'encoded')
+
+    def __init__(self, event, data, seq, on_ack=None, priority=PRIORITY_NORMAL):
+        self.event = event
+        self.data = data
+        self.seq = seq
+        self.enqueued_at = time.time()
+        self.sent_at = None
+        self.on_ack = on_ack
+        self.priority = priority
+        self.encoded = None
+
+
+def chain_ack(first, second):
+    if first is None:
+        return second
+    if second is None:
+        return first
+
+    def callback(success):
+        try:
+            first(success)
+        finally:
+            second(success)
+    return callback
+
+
+class Room(object):
+    def __init__(self, key, max_outbox=100):
+        self.key = str(key)
+        self.join_state = JOIN_NONE
+        self.max_outbox = max_outbox
+
+        self.outbox = deque()
+        self.in_flight = deque()
+        self._lock = threading.Lock()
+        self._pending_stats = None
+
+        self.next_seq = 1
+        self.acked_seq = 0
+        self.last_ack_time = 0.0
+        self.failed_count = 0
+        self.sent_version = -1
+
+    def __len__(self):
+        return len(self.outbox)
+
+    def _append(self, event, data, on_ack=None, priority=PRIORITY_NORMAL):
+        if len(self.outbox) >= self.max_outbox:
+            return None
+        message = OutboundMessage(event, data, self.next_seq, on_ack, priority)
+        self.next_seq += 1
+        self.outbox.append(message)
+        return message
+
+    def enqueue(self, event, data, on_ack=None, priority=PRIORITY_NORMAL):
+        with self._lock:
+            return self._append(event, data, on_ack, priority)
+
+    def mark_dirty(self, snapshot=None, priority=PRIORITY_NORMAL, on_ack=None):
+        # A lazy stats message (data is None) is materialized from the latest
+        # snapshot when the sender picks it up, so repeated marks coalesce.
+        with self._lock:
+            pending = self._pending_stats
+            if snapshot is None and pending is not None:
+                pending.priority = max(pending.priority, priority)
+                pending.on_ack = chain_ack(pending.on_ack, on_ack)
+                return pending
+            message = self._append('updateStats', snapshot, on_ack, priority=priority)
+            if message is not None and snapshot is None:
+                self._pending_stats = message
+            return message
+
+    def request_join(self, data):
+        with self._lock:
+            self.join_state = JOIN_PENDING
+            message = OutboundMessage('joinRoom', data, self.next_seq, priority=PRIORITY_HIGH)
+            self.next_seq += 1
+            self.outbox.appendleft(message)
+            return message
+
+    def pop(self, min_priority=PRIORITY_NORMAL):
+        with self._lock:
+            message = None
+            if min_priority <= PRIORITY_NORMAL:
+                if self.outbox:
+                    message = self.outbox.popleft()
+            else:
+                for candidate in self.outbox:
+                    if candidate.priority >= min_priority:
+                        message = candidate
+                        break
+                if message is not None:
+                    self.outbox.remove(message)
+            if message is not None and message is self._pending_stats:
+                self._pending_stats = None
+            return message
+
+    def has_pending(self, min_priority=PRIORITY_NORMAL):
+        with self._lock:
+            for message in self.outbox:
+                if message.priority >= min_priority:
+                    return True
+        return False
+
+    def requeue(self, message):
+        with self._lock:
+            if len(self.outbox) >= self.max_outbox:
+                return False
+            self.outbox.appendleft(message)
+            return True
+
+    def mark_sent(self, message, version=None):
+        if message.event == 'joinRoom':
+            self.join_state = JOIN_JOINED
+        elif message.event in ACKED_EVENTS:
+            # Only the ack callback is needed once the message is on the wire.
+            message.data = None
+            message.encoded = None
+            message.sent_at = time.time()
+            with self._lock:
+                self.in_flight.append(message)
+                expired = self._expire_in_flight(message.sent_at)
+            for lost in expired:
+                self._settle(lost, False)
+            if version is not None:
+                self.sent_version = max(self.sent_version, version)
+
+    def _expire_in_flight(self, now):
+        expired = []
+        while self.in_flight and (len(self.in_flight) > MAX_IN_FLIGHT or
+                                  now - self.in_flight[0].sent_at > IN_FLIGHT_TIMEOUT):
+            expired.append(self.in_flight.popleft())
+        return expired
+
+    def ack(self, success=True, seq=None):
+        # Acks are matched by the seq the server echoes back; a room shared
+        # with other clients also sees their acks, which match nothing here.
+        # Without a seq (older servers) the oldest message is credited.
+        with self._lock:
+            message = None
+            if seq is None:
+                if self.in_flight:
+                    message = self.in_flight.popleft()
+            else:
+                for candidate in self.in_flight:
+                    if candidate.seq == seq:
+                        message = candidate
+                        break
+                if message is not None:
+                    self.in_flight.remove(message)
+            expired = self._expire_in_flight(time.time())
+        for lost in expired:
+            self._settle(lost, False)
+        if message is not None:
+            self._settle(message, success)
+        return message
+
+    def _settle(self, message, success):
+        if success:
+            self.acked_seq = max(self.acked_seq, message.seq)
+            self.last_ack_time = time.time()
+        else:
+            self.failed_count += 1
+
+        if message.on_ack is not None:
+            try:
+                message.on_ack(success)
+            except Exception:
+                pass
+
+    def oldest_in_flight_time(self):
+        if not self.in_flight:
+            return None
+        return self.in_flight[0].enqueued_at
+
+    def reset_connection(self):
+        # Anything sent over the previous socket that never got an answer is
+        # failed so its waiters settle; the next stats update carries the full
+        # state anyway.
+        self.join_state = JOIN_NONE
+        with self._lock:
+            lost = list(self.in_flight)
+            self.in_flight.clear()
+        for message in lost:
+            self._settle(message, False)
+
+    def take_unsent(self):
+        with self._lock:
+            unsent = list(self.outbox)
+            self.outbox.clear()
+            self._pending_stats = None
+            return unsent
+
+    def clear(self):
+        with self._lock:
+            dropped = len(self.outbox)
+            lost = list(self.outbox) + list(self.in_flight)
+            self.outbox.clear()
+            self.in_flight.clear()
+            self._pending_stats = None
+        for message in lost:
+            self._settle(message, False)
+        return dropped
@@ -2,17 +2,45 @@
 import json
 import time
 import threading
-import Queue
 
-from ..utils import print_error, print_debug, g_statsWrapper
+from ..utils import print_error, print_debug, g_statsWrapper, g_metrics
+from ..utils.stats_records import encode_json
 from .web_socket_client import WebSocketClient
+from .room import Room, PRIORITY_NORMAL, PRIORITY_HIGH
 
 MAX_PAYLOAD_SIZE = 2 * 1024 * 1024
+KEEPALIVE_INTERVAL = 20.0
+
+_queueDepth = g_metrics.gauge('ws.queue_depth')
+_enqueueToSend = g_metrics.histogram('ws.enqueue_to_send_ms')
+_serializeTime = g_metrics.histogram('ws.serialize_ms')
+_connectAttempts = g_metrics.counter('ws.connect_attempts')
+_reconnects = g_metrics.counter('ws.reconnects')
+
+
+STATE_IDLE = 'idle'
+STATE_CONNECTING = 'connecting'
+STATE_READY = 'ready'
+STATE_DRAINING = 'draining'
+STATE_CLOSED = 'closed'
+
+_STATE_TRANSITIONS = {
+    STATE_IDLE: (STATE_CONNECTING, STATE_DRAINING, STATE_CLOSED),
+    STATE_CONNECTING: (STATE_READY, STATE_IDLE, STATE_DRAINING, STATE_CLOSED),
+    STATE_READY: (STATE_CONNECTING, STATE_DRAINING, STATE_CLOSED),
+    STATE_DRAINING: (STATE_CLOSED,),
+    STATE_CLOSED: (),
+}
+
+
+def _count_drop(reason):
+    g_metrics.counter('ws.dropped.{}'.format(reason)).inc()
 
 
 class ServerClient(object):
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, on_connected=None):
         self.player_id = None
+        self.on_connected = on_connected
         self.base_host = "node-websocket-758468a49fee.herokuapp.com"
         self.secure = True
         self.port = 443
@@ -27,7 +55,11 @@ class ServerClient(object):
 
         self._stop = threading.Event()
         self._sender_thread = None
-        self._queue = Queue.Queue(maxsize=100)
+        self._wakeup = threading.Event()
+
+        self._rooms = {}
+        self._rooms_lock = threading.Lock()
+        self._room_cursor = 0
 
         self._ws = None
         self._connected = False         
@@ -35,6 +67,168 @@ class ServerClient(object):
         
         self._max_reconnect_attempts = 5
         self._reconnect_delay = 5.0
+        self._was_connected = False
+        self._last_send_time = 0.0
+
+        self._state = STATE_IDLE
+        self._state_lock = threading.Lock()
+
+        if api_key is not None:
+            self.add_room(api_key)
+
+    @property
+    def state(self):
+        return self._state
+
+    @property
+    def is_connected(self):
+        return self._state == STATE_READY and bool(self._ws) and getattr(self._ws, "is_connected", False)
+
+    def _set_state(self, new_state):
+        with self._state_lock:
+            old_state = self._state
+            if old_state == new_state:
+                return True
+            if new_state not in _STATE_TRANSITIONS[old_state]:
+                print_debug("[WS] Ignoring state change {} -> {}".format(old_state, new_state))
+                return False
+            self._state = new_state
+        print_debug("[WS] State {} -> {}".format(old_state, new_state))
+        return True
+
+    def is_healthy(self):
+        state = self._state
+        if state in (STATE_DRAINING, STATE_CLOSED):
+            return False
+        if state == STATE_IDLE and self._sender_thread is None:
+            return True
+        return bool(self._sender_thread) and self._sender_thread.is_alive()
+
+    def rebind(self, api_key=None, player_id=None):
+        if not self.is_healthy():
+            return False
+
+        if player_id is not None:
+            self.player_id = str(player_id)
+
+        if api_key is not None and str(api_key) != str(self.access_key):
+            print_debug("[WS] Rebinding to API key: {}".format(api_key))
+            old_key = self.access_key
+            self.access_key = str(api_key)
+            self.add_room(api_key)
+            if old_key is not None:
+                self.remove_room(old_key)
+        return True
+
+    @property
+    def room_keys(self):
+        with self._rooms_lock:
+            return list(self._rooms.keys())
+
+    def get_room(self, key):
+        return self._rooms.get(str(key))
+
+    def add_room(self, key):
+        key = str(key)
+        with self._rooms_lock:
+            room = self._rooms.get(key)
+            if room is not None:
+                return room
+            room = Room(key)
+            self._rooms[key] = room
+        print_debug("[WS] Room added: {}".format(key))
+        if self._state == STATE_READY:
+            room.request_join(self._join_data(key))
+            self._wakeup.set()
+        return room
+
+    def remove_room(self, key):
+        key = str(key)
+        with self._rooms_lock:
+            room = self._rooms.pop(key, None)
+        if room is None:
+            return False
+        dropped = room.clear()
+        if dropped:
+            g_metrics.counter('ws.dropped.room_removed').inc(dropped)
+        print_debug("[WS] Room removed: {}".format(key))
+        return True
+
+    def sync_rooms(self, keys):
+        keys = [str(key) for key in keys if key]
+        if not keys:
+            return
+        self.access_key = keys[0]
+        for key in keys:
+            self.add_room(key)
+        for key in self.room_keys:
+            if key not in keys:
+                self.remove_room(key)
+
+    def _room_list(self):
+        with self._rooms_lock:
+            return list(self._rooms.values())
+
+    def _pending_count(self):
+        return sum(len(room) for room in self._room_list())
+
+    def _join_data(self, key):
+        data = {"key": str(key)}
+        if self.player_id is not None:
+            data["playerId"] = str(self.player_id)
+        if self.use_secret_auth and self.secret_key:
+            data["secretKey"] = str(self.secret_key)
+        return data
+
+    def _rejoin_rooms(self):
+        for room in self._room_list():
+            room.reset_connection()
+            room.request_join(self._join_data(room.key))
+        self._wakeup.set()
+        if self.on_connected is not None:
+            try:
+                self.on_connected()
+            except Exception as e:
+                print_error("[WS] on_connected error: {}".format(e))
+
+    def _enqueue(self, room, event_name, data, on_ack=None, priority=PRIORITY_NORMAL):
+        message = room.enqueue(event_name, data, on_ack, priority)
+        if message is None:
+            return False
+        _queueDepth.set(self._pending_count())
+        self._wakeup.set()
+        return True
+
+    def _next_message(self):
+        min_priority = PRIORITY_HIGH if self._state == STATE_DRAINING else PRIORITY_NORMAL
+        rooms = self._room_list()
+        count = len(rooms)
+        for offset in range(count):
+            room = rooms[(self._room_cursor + offset) % count]
+            message = room.pop(min_priority)
+            if message is not None:
+                self._room_cursor = (self._room_cursor + offset + 1) % count
+                return room, message
+        return None, None
+
+    def _ack_room(self, data, success):
+        room = None
+        seq = None
+        if isinstance(data, dict):
+            player_id = data.get("playerId")
+            if player_id is not None and self.player_id is not None and str(player_id) != str(self.player_id):
+                return
+            if data.get("key") is not None:
+                room = self.get_room(data.get("key"))
+            seq = data.get("seq")
+        if room is None:
+            oldest = None
+            for candidate in self._room_list():
+                sent_at = candidate.oldest_in_flight_time()
+                if sent_at is not None and (oldest is None or sent_at < oldest):
+                    room, oldest = candidate, sent_at
+        if room is not None:
+            room.ack(success, seq)
 
     def _rate_limit(self):
         with self.lock:
@@ -44,69 +238,104 @@ class ServerClient(object):
                 time.sleep(self.request_cooldown - delta)
             self.last_request_time = time.time()
 
-    def _prepare_battle_stats(self, battle_stats):
-        prepared = {}
-        try:
-            for arena_id, battle in (battle_stats or {}).iteritems():
-                prepared_players = {}
-                for pid, pstats in (battle.get("players", {}) or {}).iteritems():
-                    prepared_players[str(pid)] = {
-                        "name": str(pstats.get("name", "Unknown Player")),
-                        "damage": int(pstats.get("damage", 0)),
-                        "kills": int(pstats.get("kills", 0)),
-                        "points": int(pstats.get("points", 0)),
-                        "vehicle": str(pstats.get("vehicle", "Unknown Vehicle"))
-                    }
-                prepared[str(arena_id)] = {
-                    "startTime": int(battle.get("startTime", int(time.time() * 1000))),
-                    "duration": int(battle.get("duration", 0)),
-                    "win": int(battle.get("win", -1)),
-                    "mapName": str(battle.get("mapName", "Unknown Map")),
-                    "players": prepared_players
-                }
-        except Exception as e:
-            print_error("[WS] _prepare_battle_stats error: {}".format(e))
-        return prepared
-
-    def _prepare_player_info(self, player_info):
-        prepared = {}
-        try:
-            for pid, name in (player_info or {}).iteritems():
-                prepared[str(pid)] = str(name)
-        except Exception as e:
-            print_error("[WS] _prepare_player_info error: {}".format(e))
-        return prepared
-
-    def _build_payload(self, player_id, raw_data):
-        if self.use_secret_auth and not self.access_key:
-            print_error("[WS] secret_key режим: відсутній API key (payload.key) — запит не буде відправлено")
+    def _build_body(self, snapshot):
+        if snapshot is None or snapshot.is_empty():
             return None
-
-        body = {
-            "BattleStats": self._prepare_battle_stats((raw_data or {}).get("BattleStats", {})),
-            "PlayerInfo": self._prepare_player_info((raw_data or {}).get("PlayerInfo", {}))
+        return {
+            "BattleStats": snapshot.battles,
+            "PlayerInfo": snapshot.player_info
         }
 
+    def _materialize(self, room, message):
+        data = message.data
+        if message.event != 'updateStats':
+            return data, None
+        if isinstance(data, dict):
+            data["seq"] = message.seq
+            return data, None
+
+        if data is None:
+            snapshot = g_statsWrapper.snapshot()
+            if snapshot.version == room.sent_version:
+                # Nothing new since the last send; whoever is waiting on this
+                # (possibly coalesced) message is settled as delivered.
+                if message.on_ack is not None:
+                    try:
+                        message.on_ack(True)
+                    except Exception:
+                        pass
+                return None, None
+        else:
+            snapshot = data
+
+        body = self._build_body(snapshot)
+        if not body:
+            return None, None
+        body_json = snapshot.body_json()
+        timeline, marks = g_statsWrapper.timeline_delta(room.key)
+        if timeline:
+            body["Timeline"] = timeline
+            if body_json is not None:
+                body_json = body_json[:-1] + u',"Timeline":' + encode_json(timeline) + u'}'
+        payload, encoded = self._build_payload(self.player_id, body, room.key, body_json, message.seq)
+        if payload is None:
+            return None, None
+        if marks:
+            message.on_ack = self._timeline_ack(room.key, marks, message.on_ack)
+        message.data = payload
+        message.encoded = encoded
+        return payload, snapshot.version
+
+    def _timeline_ack(self, room_key, marks, on_ack=None):
+        def callback(success):
+            if success:
+                g_statsWrapper.ack_timeline(room_key, marks)
+            if on_ack is not None:
+                on_ack(success)
+        return callback
+
+    def _encode_payload(self, payload, body_json):
+        # The body arrives pre-encoded from cached per-battle fragments, so
+        # only the small envelope is serialized here.
+        text = u'{"playerId":' + encode_json(payload["playerId"]) + u',"key":' + encode_json(payload["key"])
+        if "seq" in payload:
+            text += u',"seq":' + encode_json(payload["seq"])
+        if "secretKey" in payload:
+            text += u',"secretKey":' + encode_json(payload["secretKey"])
+        return text + u',"body":' + body_json + u'}'
+
+    def _build_payload(self, player_id, body, key, body_json=None, seq=None):
+        if self.use_secret_auth and not key:
+            print_error("[WS] secret_key режим: відсутній API key (payload.key) — запит не буде відправлено")
+            _count_drop('no_api_key')
+            return None, None
+
         payload = {
             "playerId": str(player_id) if player_id is not None else None,
-            "key": str(self.access_key) if self.access_key is not None else None,
+            "key": str(key) if key is not None else None,
             "body": body
         }
+        if seq is not None:
+            payload["seq"] = seq
         if self.use_secret_auth and self.secret_key:
             payload["secretKey"] = str(self.secret_key)
 
-        if not body["BattleStats"] and not body["PlayerInfo"]:
-            return None
-
+        encoded = None
         try:
-            size = len(json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+            with _serializeTime.time():
+                if body_json is not None:
+                    encoded = self._encode_payload(payload, body_json)
+                    size = len(encoded.encode('utf-8'))
+                else:
+                    size = len(json.dumps(payload, ensure_ascii=False).encode('utf-8'))
             if size > MAX_PAYLOAD_SIZE:
                 print_error("[WS] Payload size {0} > {1} bytes, скасовано".format(size, MAX_PAYLOAD_SIZE))
-                return None
+                _count_drop('payload_too_large')
+                return None, None
         except Exception as e:
             print_error("[WS] Неможливо порахувати розмір payload: {}".format(e))
 
-        return payload
+        return payload, encoded
 
     def _on_message(self, raw):
         try:
@@ -133,9 +362,11 @@ class ServerClient(object):
 
                     elif event == "statsUpdated":
                         print_debug("[WS] statsUpdated: {}".format(data))
+                        self._ack_room(data, True)
 
                     elif event == "updateError":
                         print_error("[WS] updateError: {}".format(data))
+                        self._ack_room(data, False)
 
                     elif event == "pong":
                         print_debug("[WS] pong(event): {}".format(data))
@@ -166,11 +397,15 @@ class ServerClient(object):
             if self._ws and getattr(self._ws, "is_connected", False):
                 print_debug("[WS] Already connected, skipping")
                 return True
+
+            if not self._set_state(STATE_CONNECTING):
+                return False
                 
             attempts = 0
             while attempts < self._max_reconnect_attempts:
                 try:
                     print_debug("[WS] Connection attempt {} of {}".format(attempts + 1, self._max_reconnect_attempts))
+                    _connectAttempts.inc()
                     
                     if self._ws:
                         try:
@@ -203,6 +438,13 @@ class ServerClient(object):
                     
                     if getattr(self._ws, "is_connected", False):
                         print_debug("[WS] Successfully connected on attempt {}".format(attempts + 1))
+                        if self._was_connected:
+                            _reconnects.inc()
+                        self._was_connected = True
+                        if not self._set_state(STATE_READY):
+                            self._ws.close()
+                            return False
+                        self._rejoin_rooms()
                         return True
                     else:
                         raise Exception("Connection established but is_connected is False")
@@ -220,16 +462,41 @@ class ServerClient(object):
                     
                     self._connected = False
                     
+                    if self._stop.is_set():
+                        break
+
                     if attempts < self._max_reconnect_attempts:
                         print_debug("[WS] Retrying in {} seconds...".format(self._reconnect_delay))
-                        time.sleep(self._reconnect_delay)
+                        self._stop.wait(self._reconnect_delay)
                     
             print_error("[WS] Failed to connect after {} attempts".format(self._max_reconnect_attempts))
+            self._set_state(STATE_IDLE)
             return False
 
+    def _keepalive(self):
+        if self._state != STATE_READY:
+            return
+        if time.time() - self._last_send_time < KEEPALIVE_INTERVAL:
+            return
+        self._last_send_time = time.time()
+        if self._ws and self._ws.emit('ping', {"key": str(self.access_key)}):
+            print_debug("[WS] Keepalive ping sent")
+
+    def prewarm(self, player_id=None):
+        if player_id is not None:
+            self.player_id = str(player_id)
+        if not self.is_healthy():
+            return False
+        self._ensure_background_sender()
+        self._wakeup.set()
+        print_debug("[WS] Prewarm requested (state: {})".format(self._state))
+        return True
+
     def _ensure_background_sender(self):
         if self._sender_thread and self._sender_thread.is_alive():
             return
+        if self._state in (STATE_DRAINING, STATE_CLOSED):
+            return
         self._stop.clear()
         self._sender_thread = threading.Thread(target=self._sender_loop)
         self._sender_thread.daemon = True
@@ -243,7 +510,14 @@ class ServerClient(object):
         while not self._stop.is_set():
             try:
                 if (not self._ws) or (not getattr(self._ws, "is_connected", False)):
+                    if self._state == STATE_DRAINING:
+                        self._wakeup.wait(0.1)
+                        self._wakeup.clear()
+                        continue
+
                     print_debug("[WS] Not connected, attempting to connect...")
+                    if self._state == STATE_READY:
+                        self._set_state(STATE_CONNECTING)
                     
                     if self._connect():
                         consecutive_failures = 0
@@ -253,37 +527,45 @@ class ServerClient(object):
                         consecutive_failures += 1
                         backoff = min(backoff * 2.0, 30.0)
                         print_debug("[WS] Connection failed, waiting {} seconds (failure #{})".format(backoff, consecutive_failures))
-                        time.sleep(backoff)
+                        self._wakeup.wait(backoff)
+                        self._wakeup.clear()
                     continue
 
-                try:
-                    item = self._queue.get(timeout=1.0)
-                except Queue.Empty:
+                room, message = self._next_message()
+                if message is None:
+                    self._keepalive()
+                    self._wakeup.wait(1.0)
+                    self._wakeup.clear()
                     continue
 
-                event_name, data = item
+                _queueDepth.set(self._pending_count())
+
+                data, version = self._materialize(room, message)
+                if data is None and message.event == 'updateStats':
+                    continue
                 
-                self._rate_limit()
+                if self._state != STATE_DRAINING:
+                    self._rate_limit()
                 
+                success = False
                 if self._ws and getattr(self._ws, "is_connected", False):
-                    success = self._ws.emit(event_name, data)
+                    if message.encoded is not None:
+                        success = self._ws.emit_raw(message.event, message.encoded)
+                    else:
+                        success = self._ws.emit(message.event, data)
                     if success:
                         consecutive_failures = 0
                         backoff = 1.0
-                        print_debug("[WS] Successfully sent: {}".format(event_name))
+                        room.mark_sent(message, version)
+                        self._last_send_time = time.time()
+                        _enqueueToSend.observe((time.time() - message.enqueued_at) * 1000.0)
+                        print_debug("[WS] Successfully sent: {} (room: {})".format(message.event, room.key))
                     else:
                         print_error("[WS] Failed to send message, requeueing")
-                        try:
-                            self._queue.put(item, timeout=0.1)
-                        except Queue.Full:
-                            print_error("[WS] Queue full, message lost")
-                else:
-                    try:
-                        self._queue.put(item, timeout=0.1)
-                    except Queue.Full:
-                        print_error("[WS] Queue full, message lost")
-                
-                self._queue.task_done()
+
+                if not success and not room.requeue(message):
+                    print_error("[WS] Room outbox full, message lost")
+                    _count_drop('requeue_full')
 
             except Exception as e:
                 print_error("[WS] Sender loop error: {}".format(e))
@@ -294,7 +576,9 @@ class ServerClient(object):
                     except:
                         pass
                 self._ws = None
-                time.sleep(1.0)
+                if self._state == STATE_READY:
+                    self._set_state(STATE_CONNECTING)
+                self._stop.wait(1.0)
 
         print_debug("[WS] Sender loop stopped")
 
@@ -303,93 +587,163 @@ class ServerClient(object):
         print_debug("[WS] API key updated: {}".format(self.access_key))
 
     def join_room(self, key=None, player_id=None):
-        if key is not None:
+        if key is None:
+            key = self.access_key
+        if key is None:
+            return False
+        if self.access_key is None:
             self.access_key = str(key)
         if player_id is not None:
             self.player_id = str(player_id)
 
         self._ensure_background_sender()
-        
-        data = {"key": str(self.access_key)}
-        if self.player_id is not None:
-            data["playerId"] = str(self.player_id)
-        if self.use_secret_auth and self.secret_key:
-            data["secretKey"] = str(self.secret_key)
 
-        try:
-            self._queue.put(('joinRoom', data), timeout=0.1)
-            print_debug("[WS] Join room queued")
-            return True
-        except Queue.Full:
-            print_error("[WS] Queue full (joinRoom)")
-            return False
+        room = self.add_room(key)
+        room.request_join(self._join_data(room.key))
+        self._wakeup.set()
+        print_debug("[WS] Join room queued: {}".format(room.key))
+        return True
 
     def ping(self):
+        room = self.get_room(self.access_key) if self.access_key is not None else None
+        if room is None:
+            return False
         self._ensure_background_sender()
-        try:
-            self._queue.put(('ping', {"key": str(self.access_key)}), timeout=0.1)
-            return True
-        except Queue.Full:
-            print_error("[WS] Queue full (ping)")
+        if not self._enqueue(room, 'ping', {"key": room.key}):
+            print_error("[WS] Room outbox full (ping)")
+            _count_drop('queue_full')
             return False
+        return True
 
-    def send_stats(self, player_id=None):
+    def send_stats(self, player_id=None, priority=PRIORITY_NORMAL, on_ack=None, snapshot=None):
         if player_id is not None:
             self.player_id = str(player_id)
 
-        try:
-            raw_data = g_statsWrapper.get_raw_data()
-        except Exception as e:
-            print_error("[WS] Cannot get stats data: {}".format(e))
-            return {'success': False, 'status_code': 500, 'message': 'stats wrapper error'}
+        if snapshot is not None or priority >= PRIORITY_HIGH:
+            if snapshot is None:
+                try:
+                    snapshot = g_statsWrapper.snapshot()
+                except Exception as e:
+                    print_error("[WS] Cannot get stats data: {}".format(e))
+                    return {'success': False, 'status_code': 500, 'message': 'stats wrapper error'}
+            if snapshot.is_empty():
+                return {'success': True, 'status_code': 204, 'message': 'no content'}
 
-        payload = self._build_payload(self.player_id, raw_data)
-        if not payload:
-            return {'success': True, 'status_code': 204, 'message': 'no content'}
+        rooms = self._room_list()
+        if not rooms:
+            return {'success': False, 'status_code': 503, 'message': 'no rooms'}
 
         self._ensure_background_sender()
-        try:
-            self._queue.put(('updateStats', payload), timeout=0.1)
-            print_debug("[WS] Stats update queued for player: {}".format(self.player_id))
-            return {'success': True, 'status_code': 202, 'message': 'queued'}
-        except Queue.Full:
-            print_error("[WS] Queue full, stats update cancelled")
+        queued = 0
+        for room in rooms:
+            if room.mark_dirty(snapshot, priority, on_ack) is not None:
+                queued += 1
+            else:
+                print_error("[WS] Room {} outbox full, stats update cancelled".format(room.key))
+                _count_drop('queue_full')
+
+        if not queued:
             return {'success': False, 'status_code': 503, 'message': 'local queue full'}
+        _queueDepth.set(self._pending_count())
+        self._wakeup.set()
+        return {'success': True, 'status_code': 202, 'message': 'queued'}
 
-    def disconnect(self):
-        print_debug("[WS] Disconnecting...")
+    def has_pending(self, min_priority=PRIORITY_NORMAL):
+        for room in self._room_list():
+            if room.has_pending(min_priority):
+                return True
+        return False
+
+    def begin_drain(self):
+        if self._set_state(STATE_DRAINING):
+            self._wakeup.set()
+
+    def flush(self, deadline, min_priority=PRIORITY_HIGH):
+        while time.time() < deadline:
+            if not self.has_pending(min_priority):
+                return True
+            if not (self._ws and getattr(self._ws, "is_connected", False)):
+                return False
+            if not (self._sender_thread and self._sender_thread.is_alive()):
+                return False
+            time.sleep(0.02)
+        return not self.has_pending(min_priority)
+
+    def take_unsent(self):
+        unsent = []
+        for room in self._room_list():
+            for message in room.take_unsent():
+                if message.event != 'updateStats':
+                    continue
+                data, _ = self._materialize(room, message)
+                if data is None:
+                    continue
+                data = dict(data)
+                data.pop("secretKey", None)
+                data.pop("seq", None)
+                unsent.append({
+                    'key': room.key,
+                    'event': message.event,
+                    'data': data,
+                    'priority': message.priority,
+                    'enqueuedAt': message.enqueued_at
+                })
+        _queueDepth.set(0)
+        return unsent
+
+    def restore_unsent(self, records):
+        leftover = []
+        restored = 0
+        for record in records or []:
+            room = self.get_room(record.get('key'))
+            if room is None:
+                leftover.append(record)
+                continue
+            data = record.get('data')
+            if not isinstance(data, dict):
+                continue
+            if self.use_secret_auth and self.secret_key:
+                data["secretKey"] = str(self.secret_key)
+            if self._enqueue(room, record.get('event', 'updateStats'), data,
+                             priority=record.get('priority', PRIORITY_NORMAL)):
+                restored += 1
+            else:
+                leftover.append(record)
+        if restored:
+            self._ensure_background_sender()
+            print_debug("[WS] Restored {} spooled message(s)".format(restored))
+        return leftover
+
+    def release(self):
         self._stop.set()
-        
-        if self._ws:
-            try:
-                self._ws.close()
-            except:
-                pass
-        
-        try:
-            if self._sender_thread and self._sender_thread.is_alive():
-                print_debug("[WS] Waiting for sender thread to finish...")
-                self._sender_thread.join(timeout=3.0)
-                if self._sender_thread.is_alive():
-                    print_error("[WS] Sender thread did not terminate within timeout")
-        except Exception as e:
-            print_error("[WS] Error waiting for sender thread: {}".format(e))
-            
+        self._wakeup.set()
+
+        ws = self._ws
         self._ws = None
         self._connected = False
+        if ws:
+            try:
+                ws.abort()
+            except Exception as e:
+                print_error("[WS] Error aborting socket: {}".format(e))
+
+        self._set_state(STATE_CLOSED)
+
+    def disconnect(self):
+        print_debug("[WS] Disconnecting...")
+        self.begin_drain()
+        self.release()
         print_debug("[WS] Disconnected")
 
     def fini(self):
         print_debug("[WS] Finalizing...")
         self.disconnect()
-        
 
         try:
-            while not self._queue.empty():
-                try:
-                    self._queue.get_nowait()
-                    self._queue.task_done()
-                except:
-                    break
+            for room in self._room_list():
+                dropped = room.clear()
+                if dropped:
+                    g_metrics.counter('ws.dropped.shutdown').inc(dropped)
+            _queueDepth.set(0)
         except Exception as e:
-            print_error("[WS] Error clearing queue: {}".format(e))
\ No newline at end of file
+            print_error("[WS] Error clearing rooms: {}".format(e))
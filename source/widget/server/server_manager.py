@@ -1,6 +1,11 @@
 import threading
 import time
-from ..utils import print_debug, print_error
+from ..utils import print_debug, print_error, g_statsWrapper
+from .room import PRIORITY_NORMAL, PRIORITY_HIGH
+from .shutdown import ShutdownCoordinator, SHUTDOWN_TIMEOUT, g_outboxSpool
+
+
+SPILL_CHUNK = 16
 
 
 class ServerManager(object):
@@ -8,18 +13,29 @@ class ServerManager(object):
         self._client = None
         self._current_api_key = None
         self._lock = threading.Lock()
-        self._cleanup_timeout = 5.0
+        self._spool_pending = True
+        self._connect_listeners = []
 
-    def get_client(self, required_api_key):
+    def get_client(self, required_api_key, room_keys=None):
         with self._lock:
             try:                
                 if self._can_reuse_client(required_api_key):
-                    print_debug("[ServerManager] Reusing existing client with API key: {}".format(required_api_key))
-                    return self._client
-                
-                print_debug("[ServerManager] Creating new client, reason: {}".format(
-                    self._get_recreation_reason(required_api_key)))
-                self._recreate_client(required_api_key)
+                    if self._current_api_key != required_api_key:
+                        print_debug("[ServerManager] Rebinding client from API key '{}' to '{}'".format(
+                            self._current_api_key, required_api_key))
+                        if not room_keys:
+                            self._client.rebind(api_key=required_api_key)
+                        self._current_api_key = required_api_key
+                else:
+                    print_debug("[ServerManager] Creating new client, reason: {}".format(
+                        self._get_recreation_reason(required_api_key)))
+                    self._recreate_client(required_api_key)
+
+                if self._client and room_keys:
+                    self._client.sync_rooms(room_keys)
+                if self._client and self._spool_pending:
+                    self._spool_pending = False
+                    self._in_background(self._load_spool, self._apply_spool)
                 return self._client
                 
             except Exception as e:
@@ -29,41 +45,12 @@ class ServerManager(object):
     def _can_reuse_client(self, required_api_key):
         if self._client is None:
             return False
-        
-        if self._current_api_key != required_api_key:
-            return False
-        
-        if not hasattr(self._client, 'is_connected'):
-            return False
-            
-        if not getattr(self._client, 'is_connected', False):
-            return False
-        
-        if hasattr(self._client, '_ws') and self._client._ws:
-            if not getattr(self._client._ws, 'is_connected', False):
-                return False
-        
-        if hasattr(self._client, '_sender_thread'):
-            if not self._client._sender_thread or not self._client._sender_thread.is_alive():
-                return False
-        
-        return True
+        return self._client.is_healthy()
 
     def _get_recreation_reason(self, required_api_key):
         if self._client is None:
             return "no client exists"
-        
-        if self._current_api_key != required_api_key:
-            return "API key changed from '{}' to '{}'".format(self._current_api_key, required_api_key)
-        if not getattr(self._client, 'is_connected', False):
-            return "client not connected"
-        if hasattr(self._client, '_ws') and self._client._ws:
-            if not getattr(self._client._ws, 'is_connected', False):
-                return "WebSocket not connected"
-        if hasattr(self._client, '_sender_thread'):
-            if not self._client._sender_thread or not self._client._sender_thread.is_alive():
-                return "sender thread not alive"
-        return "unknown reason"
+        return "client unhealthy (state: {})".format(self._client.state)
     
 
     def _recreate_client(self, api_key):
@@ -80,7 +67,7 @@ class ServerManager(object):
             old_client = self._client
             
             from .server_connect import ServerClient
-            new_client = ServerClient(api_key=api_key)
+            new_client = ServerClient(api_key=api_key, on_connected=self._on_client_connected)
             
             self._client = new_client
             self._current_api_key = api_key
@@ -88,46 +75,105 @@ class ServerManager(object):
             print_debug("[ServerManager] Created new client with API key: {}".format(api_key))
             
             if old_client:
-                self._cleanup_old_client(old_client)
+                self._cleanup_old_client(old_client, new_client)
             
         except Exception as e:
             print_error("[ServerManager] Failed to recreate client: {}".format(e))
             self._client = None
             self._current_api_key = None
     
-    def _cleanup_old_client(self, old_client):
-        def cleanup_thread():
+    def _cleanup_old_client(self, old_client, new_client=None):
+        try:
+            print_debug("[ServerManager] Releasing old client (state: {})".format(old_client.state))
+            old_client.begin_drain()
+            unsent = old_client.take_unsent()
+            old_client.release()
+            if unsent and new_client:
+                unsent = new_client.restore_unsent(unsent)
+            if unsent:
+                self._in_background(g_outboxSpool.append, unsent)
+                self._spool_pending = True
+        except Exception as e:
+            print_error("[ServerManager] Error during old client cleanup: {}".format(e))
+
+    def add_connect_listener(self, listener):
+        # Listeners run on the sender thread after every (re)connect, once the
+        # rooms have been rejoined.
+        if listener not in self._connect_listeners:
+            self._connect_listeners.append(listener)
+
+    def _on_client_connected(self):
+        for listener in list(self._connect_listeners):
             try:
-                print_debug("[ServerManager] Starting cleanup of old client")
-                
-                if hasattr(old_client, '_stop'):
-                    old_client._stop.set()
-                
-                if hasattr(old_client, 'disconnect'):
-                    old_client.disconnect()
-                
-                if hasattr(old_client, '_sender_thread') and old_client._sender_thread:
-                    if old_client._sender_thread.is_alive():
-                        old_client._sender_thread.join(timeout=self._cleanup_timeout)
-                        if old_client._sender_thread.is_alive():
-                            print_error("[ServerManager] Sender thread did not terminate within timeout")
-                
-                if hasattr(old_client, '_ws') and old_client._ws:
-                    try:
-                        old_client._ws.close()
-                    except:
-                        pass
-                
-                print_debug("[ServerManager] Old client cleanup completed")
-                
+                listener()
             except Exception as e:
-                print_error("[ServerManager] Error during old client cleanup: {}".format(e))
-        
-        cleanup_worker = threading.Thread(target=cleanup_thread)
-        cleanup_worker.daemon = True
-        cleanup_worker.start()
-    
-    def send_stats(self, player_id=None):
+                print_error("[ServerManager] Connect listener error: {}".format(e))
+
+    def _in_background(self, target, *args):
+        worker = threading.Thread(target=target, args=args)
+        worker.daemon = True
+        worker.start()
+
+    def _load_spool(self, callback):
+        # Runs on a worker so the file reads stay off the game thread and
+        # outside the manager lock; the records are handed to callback.
+        try:
+            records = g_outboxSpool.take()
+        except Exception as e:
+            print_error("[ServerManager] Error reading spooled messages: {}".format(e))
+            records = []
+        try:
+            spilled = g_statsWrapper.take_spilled_battles()
+        except Exception as e:
+            print_error("[ServerManager] Error reading spilled battles: {}".format(e))
+            spilled = []
+        if records or spilled:
+            callback(records, spilled)
+
+    def _apply_spool(self, records, spilled):
+        with self._lock:
+            client = self._client
+        if client is None:
+            g_outboxSpool.append(records)
+            g_statsWrapper.restore_spilled_battles(spilled)
+            self._spool_pending = True
+            return
+        self._restore_spool(client, records)
+        self._restore_battle_spill(client, spilled)
+
+    def _restore_spool(self, client, records):
+        if not records:
+            return
+        try:
+            leftover = client.restore_unsent(records)
+            if leftover:
+                g_outboxSpool.append(leftover)
+            print_debug("[ServerManager] Restored {} of {} spooled message(s)".format(
+                len(records) - len(leftover), len(records)))
+        except Exception as e:
+            print_error("[ServerManager] Error restoring spooled messages: {}".format(e))
+
+    def _restore_battle_spill(self, client, records):
+        # Battles evicted from memory before they were sent are uploaded from
+        # the spill file once per session; anything not queued goes back.
+        if not records:
+            return
+        try:
+            leftover = []
+            for start in range(0, len(records), SPILL_CHUNK):
+                chunk = records[start:start + SPILL_CHUNK]
+                result = client.send_stats(priority=PRIORITY_HIGH,
+                                           snapshot=g_statsWrapper.spilled_snapshot(chunk))
+                if not result or not result.get('success'):
+                    leftover.extend(chunk)
+            if leftover:
+                g_statsWrapper.restore_spilled_battles(leftover)
+            print_debug("[ServerManager] Uploaded {} of {} spilled battle(s)".format(
+                len(records) - len(leftover), len(records)))
+        except Exception as e:
+            print_error("[ServerManager] Error uploading spilled battles: {}".format(e))
+
+    def send_stats(self, player_id=None, priority=PRIORITY_NORMAL, on_ack=None):
         try:
             from ..settings import g_config
             if not g_config.configParams.enabled.value:
@@ -138,59 +184,52 @@ class ServerManager(object):
             return {'success': False, 'message': 'Config unavailable'}
         
         try:
-            required_api_key = g_config.get_api_key()
+            required_api_keys = g_config.get_api_keys()
         except:
-            required_api_key = 'dev-test'
+            required_api_keys = ['dev-test']
 
-        client = self.get_client(required_api_key)
+        client = self.get_client(required_api_keys[0], room_keys=required_api_keys)
         if client:
-            return client.send_stats(player_id=player_id)
+            return client.send_stats(player_id=player_id, priority=priority, on_ack=on_ack)
         else:
             return {'success': False, 'message': 'Client not available'}
     
+    def prewarm(self, player_id=None):
+        try:
+            from ..settings import g_config
+            if not g_config.configParams.enabled.value:
+                print_debug("[ServerManager] Mod disabled, skipping prewarm")
+                return False
+            required_api_keys = g_config.get_api_keys()
+        except ImportError:
+            print_debug("[ServerManager] ImportError occurred")
+            return False
+        except:
+            required_api_keys = ['dev-test']
+
+        client = self.get_client(required_api_keys[0], room_keys=required_api_keys)
+        if client:
+            return client.prewarm(player_id=player_id)
+        return False
+
     def disconnect(self):
+        self.shutdown()
+
+    def shutdown(self, timeout=SHUTDOWN_TIMEOUT):
         with self._lock:
-            if self._client:
-                try:
-                    print_debug("[ServerManager] Disconnecting current client")
-                    self._client.disconnect()
-                    
-                    if hasattr(self._client, '_sender_thread') and self._client._sender_thread:
-                        if self._client._sender_thread.is_alive():
-                            self._client._sender_thread.join(timeout=self._cleanup_timeout)
-                    
-                except Exception as e:
-                    print_error("[ServerManager] Error during disconnect: {}".format(e))
-                finally:
-                    self._client = None
-                    self._current_api_key = None
-    
+            client = self._client
+            self._client = None
+            self._current_api_key = None
+
+        if client:
+            print_debug("[ServerManager] Shutdown initiated")
+            try:
+                ShutdownCoordinator(timeout).run([client])
+            except Exception as e:
+                print_error("[ServerManager] Error during shutdown: {}".format(e))
+
     def force_cleanup(self):
-        with self._lock:
-            if self._client:
-                print_debug("[ServerManager] Force cleanup initiated")
-                try:
-                    if hasattr(self._client, '_stop'):
-                        self._client._stop.set()
-                    
-                    if hasattr(self._client, '_ws') and self._client._ws:
-                        try:
-                            self._client._ws.close()
-                        except:
-                            pass
-                    
-                    if hasattr(self._client, '_sender_thread') and self._client._sender_thread:
-                        if self._client._sender_thread.is_alive():
-                            print_debug("[ServerManager] Waiting for sender thread to terminate")
-                            self._client._sender_thread.join(timeout=1.0)
-                            if self._client._sender_thread.is_alive():
-                                print_error("[ServerManager] Force cleanup: sender thread still alive")
-                
-                except Exception as e:
-                    print_error("[ServerManager] Error during force cleanup: {}".format(e))
-                finally:
-                    self._client = None
-                    self._current_api_key = None
+        self.shutdown()
 
 
 g_server_manager = ServerManager()
\ No newline at end of file
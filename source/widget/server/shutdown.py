@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+
+from ..utils import print_debug, print_error, g_metrics
+from ..utils.spool import Spool
+
+SHUTDOWN_TIMEOUT = 1.5
+FLUSH_SHARE = 0.6
+
+OUTBOX_SPOOL_PATH = os.path.join('mods', 'configs', 'under_pressure', 'widget_outbox.jsonl')
+
+g_outboxSpool = Spool(OUTBOX_SPOOL_PATH)
+
+
+class ShutdownCoordinator(object):
+    def __init__(self, timeout=SHUTDOWN_TIMEOUT, spool=None):
+        self.timeout = timeout
+        self.spool = spool or g_outboxSpool
+
+    def run(self, clients):
+        clients = [client for client in clients if client is not None]
+        if not clients:
+            return True
+
+        started = time.time()
+        deadline = started + self.timeout
+        flush_deadline = started + self.timeout * FLUSH_SHARE
+        print_debug("[Shutdown] Shutting down {} client(s), deadline {:.2f}s".format(len(clients), self.timeout))
+
+        for client in clients:
+            client.begin_drain()
+
+        flushed = True
+        for client in clients:
+            try:
+                flushed = client.flush(flush_deadline) and flushed
+            except Exception as e:
+                flushed = False
+                print_error("[Shutdown] Flush error: {}".format(e))
+
+        unsent = []
+        for client in clients:
+            try:
+                unsent.extend(client.take_unsent())
+            except Exception as e:
+                print_error("[Shutdown] Error collecting unsent messages: {}".format(e))
+
+        if unsent and time.time() < deadline:
+            try:
+                self.spool.append(unsent)
+                g_metrics.counter('ws.spilled').inc(len(unsent))
+                print_debug("[Shutdown] Spilled {} unsent message(s) to {}".format(len(unsent), self.spool.path))
+            except Exception as e:
+                print_error("[Shutdown] Failed to spill unsent messages: {}".format(e))
+        elif unsent:
+            g_metrics.counter('ws.dropped.shutdown').inc(len(unsent))
+
+        for client in clients:
+            try:
+                client.release()
+            except Exception as e:
+                print_error("[Shutdown] Error releasing client: {}".format(e))
+
+        print_debug("[Shutdown] Completed in {:.3f}s (flushed: {})".format(time.time() - started, flushed))
+        return flushed
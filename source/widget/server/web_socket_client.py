@@ -13,7 +13,12 @@ try:
 except NameError:
     unicode = str
 
-from ..utils import print_error, print_debug
+from ..utils import print_error, print_debug, g_metrics
+from ..utils.stats_records import encode_json
+
+_bytesSent = g_metrics.counter('ws.bytes_sent')
+_framesSent = g_metrics.meter('ws.frames_sent')
+_frameTime = g_metrics.histogram('ws.frame_ms')
 
 
 class WebSocketClient(object):
@@ -199,10 +204,13 @@ class WebSocketClient(object):
             return False
             
         try:
-            frame = self._encode_ws_frame(data)
-            if isinstance(frame, unicode):
-                frame = frame.encode('latin1')
+            with _frameTime.time():
+                frame = self._encode_ws_frame(data)
+                if isinstance(frame, unicode):
+                    frame = frame.encode('latin1')
             self.ssl_sock.sendall(frame)
+            _bytesSent.inc(len(frame))
+            _framesSent.mark()
             print_debug("[WS] Sent: {}".format(data[:50]))
             return True
         except Exception as e:
@@ -221,6 +229,14 @@ class WebSocketClient(object):
             print_error("[WS] emit error: {}".format(e))
             return False
 
+    def emit_raw(self, event, data_json):
+        try:
+            payload = u"42[" + encode_json(event) + u"," + data_json + u"]"
+            return self._send_raw(payload)
+        except Exception as e:
+            print_error("[WS] emit error: {}".format(e))
+            return False
+
     def _decode_ws_frame(self, data):
         if len(data) < 2:
             return None, data
@@ -332,6 +348,21 @@ class WebSocketClient(object):
         except Exception as e:
             print_error("[WS] message_callback error: {}".format(e))
 
+    def abort(self):
+        self._stop.set()
+        self.is_connected = False
+        sock = self.ssl_sock
+        self.ssl_sock = None
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except:
+                pass
+            try:
+                sock.close()
+            except:
+                pass
+
     def close(self):
         print_debug("[WS] Closing connection...")
         self._stop.set()
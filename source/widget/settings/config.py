@@ -6,7 +6,7 @@ from .config_param import ConfigParams
 from .config_template import Template
 from .translations import Translator
 
-from ..utils import print_error, print_debug
+from ..utils import print_error, print_debug, g_scoring
 try:
     from gui.modsSettingsApi import g_modsSettingsApi   
 except ImportError:
@@ -63,6 +63,12 @@ class Config(object):
                 body=Translator.CHOOSE_BLOGGER_BODY
             )
 
+            self.configTemplate.add_parameter_to_column2(
+                "multiRoom",
+                header=Translator.MULTI_ROOM_HEADER,
+                body=Translator.MULTI_ROOM_BODY
+            )
+
             template = self.configTemplate.generateTemplate()  
 
             print_debug("[Config] Template = {}".format(template))
@@ -164,13 +170,11 @@ class Config(object):
     def reloadSafely(self):
         try:
             self._loadConfigFileToParams()
+            g_scoring.load()
 
-            from ..server import g_serverClient, ServerClient
+            from ..server import g_serverManager
             if hasattr(self, 'configParams') and hasattr(self.configParams, 'apiKey'):
-                apiKey = self.get_api_key()
-                if apiKey != g_serverClient.access_key:
-                    g_serverClient = None
-                    g_serverClient = ServerClient(api_key=apiKey)
+                g_serverManager.get_client(self.get_api_key())
 
         except Exception as e:
             print_error("[Config] Error reloading config: {}".format(str(e)))
@@ -197,6 +201,43 @@ class Config(object):
             return True
         return False
     
+    def _get_platoon_api_key(self):
+        api_key_param = getattr(self.configParams, 'apiKey', None)
+        if not api_key_param:
+            print_debug("[Config] apiKey parameter not found for platoon type")
+            return 'dev-test'
+
+        api_key = api_key_param.value
+        if not api_key or len(str(api_key).strip()) < 3:
+            print_debug("[Config] Invalid API key for platoon type, using default")
+            return 'dev-test'
+
+        return str(api_key).strip()
+
+    def _get_blogger_api_key(self):
+        blogger_param = getattr(self.configParams, 'chooseBlogger', None)
+        if not blogger_param:
+            print_debug("[Config] chooseBlogger parameter not found")
+            return 'dev-test'
+
+        blogger_value = blogger_param.value
+        print_debug("[Config] Selected blogger: {}".format(blogger_value))
+
+        blogger_api_keys = {
+            'Palu4': 'Palu4',
+            'JOKER_UAG': 'JOKER_UAG',
+            'Smile_dimasikTV': 'Smile_dimasikTV',
+            'Venixi_ua': 'Venixi_ua',
+
+        }
+
+        api_key = blogger_api_keys.get(blogger_value)
+        if api_key:
+            return api_key
+        else:
+            print_debug("[Config] Unknown blogger '{}', using default API key".format(blogger_value))
+            return 'dev-test'
+
     def get_api_key(self):
         try:
             if not hasattr(self, 'configParams'):
@@ -212,42 +253,23 @@ class Config(object):
             print_debug("[Config] Tournament type: {}".format(tournament_type))
             
             if tournament_type == 'platoon':
-                api_key_param = getattr(self.configParams, 'apiKey', None)
-                if not api_key_param:
-                    print_debug("[Config] apiKey parameter not found for platoon type")
-                    return 'dev-test'
-                
-                api_key = api_key_param.value
-                if not api_key or len(str(api_key).strip()) < 3:
-                    print_debug("[Config] Invalid API key for platoon type, using default")
-                    return 'dev-test'
-                
-                return str(api_key).strip()
-            
+                return self._get_platoon_api_key()
             else:
-                blogger_param = getattr(self.configParams, 'chooseBlogger', None)
-                if not blogger_param:
-                    print_debug("[Config] chooseBlogger parameter not found")
-                    return 'dev-test'
-                
-                blogger_value = blogger_param.value
-                print_debug("[Config] Selected blogger: {}".format(blogger_value))
-                
-                blogger_api_keys = {
-                    'Palu4': 'Palu4',
-                    'JOKER_UAG': 'JOKER_UAG',
-                    'Smile_dimasikTV': 'Smile_dimasikTV',
-                    'Venixi_ua': 'Venixi_ua',
-
-                }
-                
-                api_key = blogger_api_keys.get(blogger_value)
-                if api_key:
-                    return api_key
-                else:
-                    print_debug("[Config] Unknown blogger '{}', using default API key".format(blogger_value))
-                    return 'dev-test'
+                return self._get_blogger_api_key()
         
         except Exception as e:
             print_error("[Config] Error getting API key: {}".format(e))
-            return 'dev-test'
\ No newline at end of file
+            return 'dev-test'
+
+    def get_api_keys(self):
+        primary_key = self.get_api_key()
+        api_keys = [primary_key]
+        try:
+            multi_room_param = getattr(self.configParams, 'multiRoom', None)
+            if multi_room_param and multi_room_param.value:
+                for api_key in (self._get_platoon_api_key(), self._get_blogger_api_key()):
+                    if api_key not in api_keys:
+                        api_keys.append(api_key)
+        except Exception as e:
+            print_error("[Config] Error getting API keys: {}".format(e))
+        return api_keys
\ No newline at end of file
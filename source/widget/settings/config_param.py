@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from .config_param_types import CheckboxParameter, TextInputParameter, DropdownParameter, RadioButtonGroupParameter, OptionItem
+from .config_param_types import CheckboxParameter, TextInputParameter, DropdownParameter, RadioButtonGroupParameter, OptionItem, StepperParameter
 from .translations import Translator
 
 class ConfigParams(object):    
@@ -24,6 +24,25 @@ class ConfigParams(object):
             maxLength=10
         )
 
+        self.multiRoom = CheckboxParameter(
+            ['multiRoom'],
+            defaultValue=False
+        )
+
+        self.metricsDump = CheckboxParameter(
+            ['metricsDump'],
+            defaultValue=False
+        )
+
+        self.liveUpdateInterval = StepperParameter(
+            ['liveUpdateInterval'],
+            castFunction=int,
+            minValue=100,
+            step=50,
+            maxValue=2000,
+            defaultValue=250
+        )
+
         self.chooseBlogger = DropdownParameter(
             ['chooseBlogger'],
             defaultValue='Palu4',
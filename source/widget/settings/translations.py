@@ -229,6 +229,8 @@ class Translator(object):
     BATTLE_BLOGGERS_BODY = TranslationElement("battleBloggers.body")
     CHOOSE_BLOGGER_HEADER = TranslationElement("chooseBlogger.header")
     CHOOSE_BLOGGER_BODY = TranslationElement("chooseBlogger.body")
+    MULTI_ROOM_HEADER = TranslationElement("multiRoom.header")
+    MULTI_ROOM_BODY = TranslationElement("multiRoom.body")
     BLOGGER_PALU4 = TranslationElement("blogger.Palu4")
     BLOGGER_VGOSTI = TranslationElement("blogger.Vgosti")
     BLOGGER_YKP_BOIH = TranslationElement("blogger.YKP_BOIH")
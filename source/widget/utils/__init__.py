@@ -1,11 +1,15 @@
 # -*- coding: utf-8 -*-
 from .stats_wraper import StatsWrapper
+from .metrics import MetricsRegistry
+from .scoring import ScoringEngine, SCORING_RULES_PATH
 
 __all__ = [
     'print_log',
     'print_error',
     'print_debug',
-    'g_statsWrapper'
+    'g_statsWrapper',
+    'g_metrics',
+    'g_scoring'
 ]
 
 DEBUG_MODE = True
@@ -22,4 +26,7 @@ def print_debug(log):
         print("[WIDGET] [DEBUG]: {}".format(str(log)))
 
 
-g_statsWrapper = StatsWrapper()
\ No newline at end of file
+g_scoring = ScoringEngine(path=SCORING_RULES_PATH)
+g_scoring.load()
+g_statsWrapper = StatsWrapper(scoring=g_scoring)
+g_metrics = MetricsRegistry()
\ No newline at end of file
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+EVENT_DAMAGE = 1
+EVENT_KILL = 2
+EVENT_CORRECTION = 3
+
+# Index of each field inside an aggregate row: [damage, kills, hits]
+AGG_DAMAGE = 0
+AGG_KILLS = 1
+AGG_HITS = 2
+
+
+class BattleEventLog(object):
+    __slots__ = ('arena_id', 'started_at', 'timestamps', 'targets', 'damages', 'types', 'attackers',
+                 '_aggregates', 'total_damage', 'total_kills')
+
+    def __init__(self, arena_id, started_at=None):
+        self.arena_id = arena_id
+        self.started_at = started_at or time.time()
+        self.timestamps = array('d')
+        self.targets = array('i')
+        self.damages = array('i')
+        self.types = array('B')
+        self.attackers = array('i')
+        self._aggregates = {}
+        self.total_damage = 0
+        self.total_kills = 0
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def append(self, event_type, attacker, target, damage=0, timestamp=None):
+        timestamp = timestamp or time.time()
+        # Events arrive in order from the client; clamp so range queries can bisect.
+        if self.timestamps and timestamp < self.timestamps[-1]:
+            timestamp = self.timestamps[-1]
+        self.timestamps.append(timestamp)
+        self.targets.append(int(target))
+        self.damages.append(int(damage))
+        self.types.append(event_type)
+        self.attackers.append(int(attacker))
+        self._apply(event_type, int(attacker), int(damage))
+        return len(self.timestamps) - 1
+
+    def _apply(self, event_type, attacker, damage):
+        aggregate = self._aggregates.get(attacker)
+        if aggregate is None:
+            aggregate = self._aggregates[attacker] = [0, 0, 0]
+        if event_type == EVENT_DAMAGE:
+            aggregate[AGG_DAMAGE] += damage
+            aggregate[AGG_HITS] += 1
+            self.total_damage += damage
+        elif event_type == EVENT_KILL:
+            aggregate[AGG_KILLS] += 1
+            self.total_kills += 1
+        elif event_type == EVENT_CORRECTION:
+            aggregate[AGG_DAMAGE] += damage
+            self.total_damage += damage
+
+    def aggregate(self, attacker):
+        aggregate = self._aggregates.get(attacker)
+        if aggregate is None:
+            return 0, 0, 0
+        return tuple(aggregate)
+
+    def damage_by(self, attacker):
+        return self.aggregate(attacker)[AGG_DAMAGE]
+
+    def kills_by(self, attacker):
+        return self.aggregate(attacker)[AGG_KILLS]
+
+    def replay(self):
+        self._aggregates = {}
+        self.total_damage = 0
+        self.total_kills = 0
+        for index in range(len(self.timestamps)):
+            self._apply(self.types[index], self.attackers[index], self.damages[index])
+        return self._aggregates
+
+    def reconcile(self, attacker, damage, kills):
+        # battleResults is authoritative: record the difference as a correction
+        # row so the log still replays to the final totals.
+        current_damage, current_kills, _ = self.aggregate(attacker)
+        damage_delta = int(damage) - current_damage
+        kills_delta = int(kills) - current_kills
+        if damage_delta:
+            self.append(EVENT_CORRECTION, attacker, 0, damage_delta)
+        while kills_delta > 0:
+            self.append(EVENT_KILL, attacker, 0)
+            kills_delta -= 1
+        return damage_delta, int(kills) - current_kills
+
+    def index_range(self, start_time=None, end_time=None):
+        start = 0 if start_time is None else bisect_left(self.timestamps, start_time)
+        stop = len(self.timestamps) if end_time is None else bisect_right(self.timestamps, end_time)
+        return start, stop
+
+    def damage_between(self, start_time=None, end_time=None, attacker=None):
+        start, stop = self.index_range(start_time, end_time)
+        total = 0
+        for index in range(start, stop):
+            if self.types[index] != EVENT_DAMAGE:
+                continue
+            if attacker is not None and self.attackers[index] != attacker:
+                continue
+            total += self.damages[index]
+        return total
+
+    def iter_events(self, start=0, stop=None):
+        if stop is None or stop > len(self.timestamps):
+            stop = len(self.timestamps)
+        for index in range(max(0, start), stop):
+            yield (self.timestamps[index], self.targets[index], self.damages[index],
+                   self.types[index], self.attackers[index])
+
+    def serialize(self, start=0, stop=None, chunk_size=256):
+        # Yields lists of compact rows [offsetMs, target, damage, type, attacker]
+        # so large ranges can be written out without building one big list.
+        chunk = []
+        for timestamp, target, damage, event_type, attacker in self.iter_events(start, stop):
+            chunk.append([int((timestamp - self.started_at) * 1000), target, damage, event_type, attacker])
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def estimate_bytes(self):
+        return len(self.timestamps) * 21 + len(self._aggregates) * 96
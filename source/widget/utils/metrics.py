@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class _ThreadShards(object):
+    # Every recording thread writes only into its own shard, so the hot path
+    # never takes a lock. Readers sum the shards when a snapshot is requested.
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+
+    def local(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._factory()
+            self._local.shard = shard
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def all(self):
+        with self._shards_lock:
+            return list(self._shards)
+
+    def reset(self):
+        with self._shards_lock:
+            self._shards = []
+        self._local = threading.local()
+
+
+class Counter(object):
+    def __init__(self, name):
+        self.name = name
+        self._shards = _ThreadShards(lambda: [0])
+
+    def inc(self, value=1):
+        self._shards.local()[0] += value
+
+    @property
+    def value(self):
+        return sum(shard[0] for shard in self._shards.all())
+
+    def reset(self):
+        self._shards.reset()
+
+
+class Gauge(object):
+    def __init__(self, name):
+        self.name = name
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def reset(self):
+        self.value = 0
+
+
+class Histogram(object):
+    def __init__(self, name, buckets=LATENCY_BUCKETS_MS):
+        self.name = name
+        self.buckets = tuple(buckets)
+        size = len(self.buckets) + 1
+        # shard layout: [count, sum, max, bucket_0 .. bucket_n, overflow]
+        self._shards = _ThreadShards(lambda: [0, 0.0, 0.0] + [0] * size)
+
+    def observe(self, value):
+        shard = self._shards.local()
+        shard[0] += 1
+        shard[1] += value
+        if value > shard[2]:
+            shard[2] = value
+        shard[3 + bisect_left(self.buckets, value)] += 1
+
+    def time(self):
+        return _HistogramTimer(self)
+
+    def summary(self):
+        count, total, peak = 0, 0.0, 0.0
+        counts = [0] * (len(self.buckets) + 1)
+        for shard in self._shards.all():
+            count += shard[0]
+            total += shard[1]
+            peak = max(peak, shard[2])
+            for idx, value in enumerate(shard[3:]):
+                counts[idx] += value
+        return {
+            'count': count,
+            'sum': round(total, 3),
+            'max': round(peak, 3),
+            'avg': round(total / count, 3) if count else 0.0,
+            'p50': self._percentile(counts, count, 0.50),
+            'p95': self._percentile(counts, count, 0.95),
+            'buckets': counts
+        }
+
+    def _percentile(self, counts, count, fraction):
+        if not count:
+            return 0
+        threshold = count * fraction
+        seen = 0
+        for idx, value in enumerate(counts):
+            seen += value
+            if seen >= threshold:
+                return self.buckets[idx] if idx < len(self.buckets) else None
+        return None
+
+    def reset(self):
+        self._shards.reset()
+
+
+class _HistogramTimer(object):
+    def __init__(self, histogram):
+        self._histogram = histogram
+        self._started = 0.0
+
+    def __enter__(self):
+        self._started = time.time()
+        return self
+
+    def __exit__(self, *args):
+        self._histogram.observe((time.time() - self._started) * 1000.0)
+        return False
+
+
+class Meter(object):
+    def __init__(self, name, window=1.0):
+        self.name = name
+        self.window = window
+        self._counter = Counter(name)
+        self._sample_time = time.time()
+        self._sample_total = 0
+        self._rate = 0.0
+
+    def mark(self, value=1):
+        self._counter.inc(value)
+
+    @property
+    def total(self):
+        return self._counter.value
+
+    @property
+    def rate(self):
+        now = time.time()
+        elapsed = now - self._sample_time
+        if elapsed >= self.window:
+            total = self._counter.value
+            self._rate = (total - self._sample_total) / elapsed
+            self._sample_time = now
+            self._sample_total = total
+        return self._rate
+
+    def reset(self):
+        self._counter.reset()
+        self._sample_time = time.time()
+        self._sample_total = 0
+        self._rate = 0.0
+
+
+class MetricsRegistry(object):
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._dump_stop = threading.Event()
+        self._dump_thread = None
+
+    def _get_or_create(self, name, cls, *args):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric = cls(name, *args)
+                    self._metrics[name] = metric
+        return metric
+
+    def counter(self, name):
+        return self._get_or_create(name, Counter)
+
+    def gauge(self, name):
+        return self._get_or_create(name, Gauge)
+
+    def histogram(self, name, buckets=LATENCY_BUCKETS_MS):
+        return self._get_or_create(name, Histogram, buckets)
+
+    def meter(self, name):
+        return self._get_or_create(name, Meter)
+
+    def snapshot(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        counters, gauges, histograms, meters = {}, {}, {}, {}
+        for metric in metrics:
+            if isinstance(metric, Counter):
+                counters[metric.name] = metric.value
+            elif isinstance(metric, Gauge):
+                gauges[metric.name] = metric.value
+            elif isinstance(metric, Histogram):
+                histograms[metric.name] = metric.summary()
+            elif isinstance(metric, Meter):
+                meters[metric.name] = {'total': metric.total, 'rate': round(metric.rate, 3)}
+
+        return {
+            'time': int(time.time()),
+            'uptime': int(time.time() - self._started),
+            'counters': counters,
+            'gauges': gauges,
+            'histograms': histograms,
+            'meters': meters
+        }
+
+    def reset(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.reset()
+
+    def dump(self, path):
+        data = json.dumps(self.snapshot(), separators=(',', ':'), sort_keys=True)
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(data)
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(tmp_path, path)
+
+    def start_dump(self, path, interval=60.0):
+        if self._dump_thread and self._dump_thread.is_alive():
+            return
+        self._dump_stop.clear()
+
+        def dump_loop():
+            while not self._dump_stop.wait(interval):
+                try:
+                    self.dump(path)
+                except Exception:
+                    pass
+
+        self._dump_thread = threading.Thread(target=dump_loop)
+        self._dump_thread.daemon = True
+        self._dump_thread.start()
+
+    def stop_dump(self, path=None):
+        self._dump_stop.set()
+        self._dump_thread = None
+        if path:
+            try:
+                self.dump(path)
+            except Exception:
+                pass
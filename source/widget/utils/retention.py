@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+BATTLE_BASE_BYTES = 160
+PLAYER_BASE_BYTES = 120
+PLAYER_INFO_BYTES = 48
+
+
+def estimate_battle_bytes(battle):
+    size = BATTLE_BASE_BYTES + len(battle.map_name) * 2
+    for player in battle.players.values():
+        size += PLAYER_BASE_BYTES + (len(player.name) + len(player.vehicle)) * 2
+    return size
+
+
+def estimate_player_info_bytes(player_name):
+    return PLAYER_INFO_BYTES + len(player_name) * 2
+
+
+class RetentionPolicy(object):
+    def __init__(self, ttl=2 * 3600, max_entries=16, max_bytes=256 * 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+    def select_evictions(self, entries, now):
+        # entries: iterable of (key, last_used, size). The most recently used
+        # entry is never evicted, so the battle in progress always survives.
+        ordered = sorted(entries, key=lambda entry: entry[1])
+        if len(ordered) <= 1:
+            return []
+
+        newest = ordered[-1]
+        evicted = []
+        kept = []
+        for entry in ordered[:-1]:
+            if self.ttl and now - entry[1] > self.ttl:
+                evicted.append(entry[0])
+            else:
+                kept.append(entry)
+        kept.append(newest)
+
+        total = sum(entry[2] for entry in kept)
+        while len(kept) > 1 and ((self.max_entries and len(kept) > self.max_entries) or
+                                 (self.max_bytes and total > self.max_bytes)):
+            entry = kept.pop(0)
+            total -= entry[2]
+            evicted.append(entry[0])
+        return evicted
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+
+SCORING_RULES_PATH = os.path.join('mods', 'configs', 'under_pressure', 'widget_scoring.json')
+
+STAT_DAMAGE = 'damage'
+STAT_KILLS = 'kills'
+STAT_ASSIST = 'assist'
+STAT_BLOCKED = 'blocked'
+STAT_CAPTURE = 'capture'
+STAT_DEFENCE = 'defence'
+STAT_SPOTTED = 'spotted'
+
+# battleResults vehicle fields summed into each scoring stat.
+RESULT_FIELDS = {
+    STAT_DAMAGE: ('damageDealt',),
+    STAT_KILLS: ('kills',),
+    STAT_ASSIST: ('damageAssistedRadio', 'damageAssistedTrack', 'damageAssistedStun'),
+    STAT_BLOCKED: ('damageBlockedByArmor',),
+    STAT_CAPTURE: ('capturePoints',),
+    STAT_DEFENCE: ('droppedCapturePoints',),
+    STAT_SPOTTED: ('spotted',),
+}
+
+DEFAULT_RULES = {
+    "weights": {
+        STAT_DAMAGE: 1,
+        STAT_KILLS: 400,
+        STAT_ASSIST: 0,
+        STAT_BLOCKED: 0,
+        STAT_CAPTURE: 0,
+        STAT_DEFENCE: 0,
+        STAT_SPOTTED: 0
+    },
+    "tierMultipliers": {}
+}
+
+
+class ScoringEngine(object):
+    def __init__(self, rules=None, path=None):
+        self.path = path
+        self.rules = None
+        self._weights = {}
+        self._terms = ()
+        self._multipliers = {}
+        self.compile(rules or DEFAULT_RULES)
+
+    def compile(self, rules):
+        # Rules are flattened once into plain dicts/tuples so per-event scoring
+        # is a couple of lookups and a multiply.
+        weights = {}
+        for stat, weight in (rules.get("weights") or {}).items():
+            if stat in RESULT_FIELDS and weight:
+                weights[stat] = float(weight)
+
+        multipliers = {}
+        for tier, multiplier in (rules.get("tierMultipliers") or {}).items():
+            try:
+                multipliers[int(tier)] = float(multiplier)
+            except (TypeError, ValueError):
+                continue
+
+        self.rules = rules
+        self._weights = weights
+        self._terms = tuple(weights.items())
+        self._multipliers = multipliers
+
+    def multiplier(self, tier=None):
+        if tier is None:
+            return 1.0
+        return self._multipliers.get(tier, 1.0)
+
+    def event_points(self, stat, amount, tier=None):
+        weight = self._weights.get(stat)
+        if not weight or not amount:
+            return 0
+        return int(round(weight * amount * self.multiplier(tier)))
+
+    def score(self, stats, tier=None):
+        total = 0.0
+        for stat, weight in self._terms:
+            total += weight * stats.get(stat, 0)
+        return int(round(total * self.multiplier(tier)))
+
+    def extract(self, vehicle_result):
+        stats = {}
+        for stat, fields in RESULT_FIELDS.items():
+            stats[stat] = sum(int(vehicle_result.get(field, 0) or 0) for field in fields)
+        return stats
+
+    def score_result(self, vehicle_result, tier=None):
+        return self.score(self.extract(vehicle_result), tier)
+
+    def load(self, path=None):
+        path = path or self.path
+        if not path:
+            return False
+        self.path = path
+        try:
+            if not os.path.exists(path):
+                directory = os.path.dirname(path)
+                if directory and not os.path.exists(directory):
+                    os.makedirs(directory)
+                with open(path, 'w') as f:
+                    json.dump(DEFAULT_RULES, f, indent=4)
+                self.compile(DEFAULT_RULES)
+                return True
+            with open(path, 'r') as f:
+                rules = json.load(f)
+            if not isinstance(rules, dict):
+                return False
+            self.compile(rules)
+            return True
+        except Exception:
+            self.compile(DEFAULT_RULES)
+            return False
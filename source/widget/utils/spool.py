@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import threading
+import time
+
+
+class Spool(object):
+    def __init__(self, path, max_records=500, max_age=7 * 24 * 3600):
+        self.path = path
+        self.max_records = max_records
+        self.max_age = max_age
+        self._lock = threading.Lock()
+
+    def _ensure_dir(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return []
+        records = []
+        oldest = time.time() - self.max_age
+        with open(self.path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(record, dict):
+                    continue
+                if record.get('spooledAt', 0) < oldest:
+                    continue
+                records.append(record)
+        return records[-self.max_records:]
+
+    def _write(self, records):
+        self._ensure_dir()
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            for record in records[-self.max_records:]:
+                f.write(json.dumps(record, separators=(',', ':')))
+                f.write('\n')
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(tmp_path, self.path)
+
+    def append(self, records):
+        if not records:
+            return 0
+        now = time.time()
+        with self._lock:
+            self._ensure_dir()
+            with open(self.path, 'a') as f:
+                for record in records:
+                    record.setdefault('spooledAt', now)
+                    f.write(json.dumps(record, separators=(',', ':')))
+                    f.write('\n')
+        return len(records)
+
+    def load(self):
+        with self._lock:
+            return self._read()
+
+    def replace(self, records):
+        with self._lock:
+            if records:
+                self._write(records)
+            elif os.path.exists(self.path):
+                os.remove(self.path)
+
+    def take(self):
+        with self._lock:
+            records = self._read()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return records
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+from collections import OrderedDict
+
+try:
+    unicode
+except NameError:
+    unicode = str
+
+MAX_INTERNED = 2048
+
+# Least recently used names and vehicles fall out once the table is full;
+# records keep their own references, they just stop sharing them.
+_interned = OrderedDict()
+_interned_lock = threading.Lock()
+
+
+def encode_json(value):
+    text = json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+    if not isinstance(text, unicode):
+        text = text.decode('utf-8')
+    return text
+
+
+def intern_text(value):
+    if not isinstance(value, unicode):
+        if isinstance(value, bytes):
+            value = value.decode('utf-8', 'replace')
+        else:
+            value = unicode(value)
+    with _interned_lock:
+        interned = _interned.pop(value, value)
+        _interned[interned] = interned
+        if len(_interned) > MAX_INTERNED:
+            _interned.popitem(last=False)
+    return interned
+
+
+class PlayerRecord(object):
+    __slots__ = ('name', 'damage', 'kills', 'points', 'vehicle')
+
+    def __init__(self, name=u"Unknown Player", damage=0, kills=0, points=0, vehicle=u"Unknown Vehicle"):
+        self.name = intern_text(name)
+        self.damage = int(damage)
+        self.kills = int(kills)
+        self.points = int(points)
+        self.vehicle = intern_text(vehicle)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            name=data.get("name", u"Unknown Player"),
+            damage=data.get("damage", 0),
+            kills=data.get("kills", 0),
+            points=data.get("points", 0),
+            vehicle=data.get("vehicle", u"Unknown Vehicle")
+        )
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "damage": self.damage,
+            "kills": self.kills,
+            "points": self.points,
+            "vehicle": self.vehicle
+        }
+
+    to_wire = to_dict
+
+
+class BattleRecord(object):
+    __slots__ = ('start_time', 'duration', 'win', 'map_name', 'players')
+
+    def __init__(self, start_time=0, duration=0, win=-1, map_name=u"Unknown Map"):
+        self.start_time = int(start_time)
+        self.duration = int(duration)
+        self.win = int(win)
+        self.map_name = intern_text(map_name)
+        self.players = {}
+
+    @classmethod
+    def from_dict(cls, data):
+        record = cls(
+            start_time=data.get("startTime", 0),
+            duration=data.get("duration", 0),
+            win=data.get("win", -1),
+            map_name=data.get("mapName", u"Unknown Map")
+        )
+        for player_id, player in (data.get("players") or {}).items():
+            record.players[player_id] = PlayerRecord.from_dict(player)
+        return record
+
+    def to_dict(self):
+        return {
+            "startTime": self.start_time,
+            "duration": self.duration,
+            "win": self.win,
+            "mapName": self.map_name,
+            "players": dict((player_id, player.to_dict()) for player_id, player in self.players.items())
+        }
+
+    def header_wire(self):
+        return {
+            "startTime": self.start_time,
+            "duration": self.duration,
+            "win": self.win,
+            "mapName": self.map_name
+        }
+
+    def to_wire(self):
+        wire = self.header_wire()
+        wire["players"] = dict((str(player_id), player.to_wire()) for player_id, player in self.players.items())
+        return wire
+
+
+class StatsSnapshot(object):
+    __slots__ = ('version', 'battles', 'player_info', 'battles_json', 'player_info_json', '_body_json')
+
+    def __init__(self, version, battles, player_info, battles_json=None, player_info_json=None):
+        self.version = version
+        self.battles = battles
+        self.player_info = player_info
+        self.battles_json = battles_json
+        self.player_info_json = player_info_json
+        self._body_json = None
+
+    def is_empty(self):
+        return not self.battles and not self.player_info
+
+    def body_json(self):
+        if self._body_json is None:
+            if self.battles_json is None or self.player_info_json is None:
+                return None
+            battles = u','.join(encode_json(key) + u':' + text for key, text in self.battles_json.items())
+            self._body_json = u'{"BattleStats":{' + battles + u'},"PlayerInfo":' + self.player_info_json + u'}'
+        return self._body_json
@@ -1,145 +1,464 @@
 # -*- coding: utf-8 -*-
+import os
+import threading
+import time
+
+from .stats_records import BattleRecord, PlayerRecord, StatsSnapshot, intern_text, encode_json
+from .event_log import BattleEventLog, EVENT_DAMAGE, EVENT_KILL
+from .timeline import DamageTimeline
+from .scoring import ScoringEngine, STAT_DAMAGE, STAT_KILLS
+from .retention import RetentionPolicy, estimate_battle_bytes, estimate_player_info_bytes
+from .spool import Spool
+
+BATTLE_SPILL_PATH = os.path.join('mods', 'configs', 'under_pressure', 'widget_battles_spill.jsonl')
+
+
 class StatsWrapper(object):
-    
-    def __init__(self, data=None):
-        self.pointPerFrag = 400
-        if data is None:
-            self.data = {
-                "BattleStats": {},
-                "PlayerInfo": {}
-            }
+
+    def __init__(self, data=None, scoring=None):
+        self.scoring = scoring or ScoringEngine()
+        self.data = {
+            "BattleStats": {},
+            "PlayerInfo": {}
+        }
+        if data is not None:
+            for arena_id, battle in (data.get("BattleStats") or {}).items():
+                self.data["BattleStats"][arena_id] = BattleRecord.from_dict(battle)
+            for player_id, player_name in (data.get("PlayerInfo") or {}).items():
+                self.data["PlayerInfo"][player_id] = intern_text(player_name)
+
+        self._lock = threading.Lock()
+        self._version = 0
+        # arena_id -> (wire, json) for the battle envelope, and
+        # arena_id -> {player_id: (wire, json)} for each clean player.
+        self._battle_wire = {}
+        self._player_wire = {}
+        self._player_info_wire = None
+        # player_id -> '"id":"name"' text, so one changed entry does not
+        # re-encode the whole PlayerInfo.
+        self._player_info_json = {}
+        self._snapshot = None
+        self._event_logs = {}
+        self._timelines = {}
+
+        self.battleRetention = RetentionPolicy(ttl=2 * 3600, max_entries=16, max_bytes=256 * 1024)
+        self.playerInfoRetention = RetentionPolicy(ttl=12 * 3600, max_entries=32, max_bytes=8 * 1024)
+        self.spill = Spool(BATTLE_SPILL_PATH, max_records=200)
+        now = time.time()
+        self._battle_used = dict((arena_id, now) for arena_id in self.data["BattleStats"])
+        self._player_info_used = dict((player_id, now) for player_id in self.data["PlayerInfo"])
+        self._evicted_battles = 0
+        self._evicted_player_info = 0
+        self._spilled_battles = 0
+
+    @property
+    def version(self):
+        return self._version
+
+    def _touch_battle(self, arena_id):
+        self._battle_wire.pop(arena_id, None)
+        self._player_wire.pop(arena_id, None)
+        if arena_id in self.data["BattleStats"]:
+            self._battle_used[arena_id] = time.time()
+        else:
+            self._battle_used.pop(arena_id, None)
+        self._version += 1
+
+    def _touch_player(self, arena_id, player_id):
+        self._battle_wire.pop(arena_id, None)
+        players = self._player_wire.get(arena_id)
+        if players is not None:
+            players.pop(player_id, None)
+        self._battle_used[arena_id] = time.time()
+        self._version += 1
+
+    def _touch_player_info(self, player_id=None):
+        if player_id is None:
+            self._player_info_json = {}
         else:
-            self.data = data
-            
+            self._player_info_json.pop(player_id, None)
+        self._player_info_wire = None
+        self._version += 1
+
     def _get_player_data(self, arena_id, player_id):
-        battle = self.get_battle(arena_id)
-        if battle and player_id in battle.get("players", {}):
-            return battle["players"][player_id]
+        battle = self.data["BattleStats"].get(arena_id)
+        if battle is not None:
+            return battle.players.get(player_id)
         return None
 
     def add_player_info(self, player_id, player_name):
         if not player_id or not player_name:
             return
-        self.data["PlayerInfo"][(player_id)] = (player_name)
-    
+        player_name = intern_text(player_name)
+        with self._lock:
+            self._player_info_used[player_id] = time.time()
+            if self.data["PlayerInfo"].get(player_id) == player_name:
+                return
+            self.data["PlayerInfo"][player_id] = player_name
+            self._touch_player_info(player_id)
+        self.enforce_retention()
+
     def get_all_players_info(self):
         return dict(self.data["PlayerInfo"])
-    
+
     def remove_player_info(self, player_id):
-        player_id = (player_id)
-        if player_id in self.data["PlayerInfo"]:
-            del self.data["PlayerInfo"][player_id]
-            return True
+        with self._lock:
+            if player_id in self.data["PlayerInfo"]:
+                del self.data["PlayerInfo"][player_id]
+                self._player_info_used.pop(player_id, None)
+                self._touch_player_info(player_id)
+                return True
         return False
-    
+
     def create_battle(self, arena_id, start_time=0, duration=0, win=-1, map_name=u"Unknown Map"):
         if not arena_id:
             return
-        self.data["BattleStats"][arena_id] = {
-            "startTime": start_time,
-            "duration": duration,
-            "win": win,
-            "mapName": unicode(map_name),
-            "players": {}
-        }
-    
+        with self._lock:
+            self.data["BattleStats"][arena_id] = BattleRecord(start_time, duration, win, map_name)
+            self._touch_battle(arena_id)
+        self.enforce_retention()
+
     def get_battle(self, arena_id):
+        battle = self.data["BattleStats"].get(arena_id)
+        if battle is not None:
+            return battle.to_dict()
+        return None
+
+    def get_battle_record(self, arena_id):
         return self.data["BattleStats"].get(arena_id)
-    
+
     def get_all_battles(self):
         return list(self.data["BattleStats"].keys())
-    
+
     def remove_battle(self, arena_id):
-        if arena_id in self.data["BattleStats"]:
-            del self.data["BattleStats"][arena_id]
-            return True
+        with self._lock:
+            if arena_id in self.data["BattleStats"]:
+                del self.data["BattleStats"][arena_id]
+                self._event_logs.pop(arena_id, None)
+                self._timelines.pop(arena_id, None)
+                self._touch_battle(arena_id)
+                return True
         return False
-    
+
     def add_player_to_battle(self, arena_id, player_id, name=u"Unknown Player", damage=0, kills=0, points=0, vehicle=u"Unknown Vehicle"):
 
-        if arena_id not in self.data[u"BattleStats"]:
+        if arena_id not in self.data["BattleStats"]:
             self.create_battle(arena_id)
-        
-        self.data["BattleStats"][arena_id]["players"][player_id] = {
-            "name": unicode(name), "damage": damage, "kills": kills,
-            "points": points, "vehicle": unicode(vehicle)
-        }
-    
+
+        with self._lock:
+            self.data["BattleStats"][arena_id].players[player_id] = PlayerRecord(name, damage, kills, points, vehicle)
+            self._touch_player(arena_id, player_id)
+
     def get_player_battle_stats(self, arena_id, player_id):
         player_data = self._get_player_data(arena_id, player_id)
         if player_data:
-            return dict(player_data) 
+            return player_data.to_dict()
         return None
 
     def update_battle_stats(self, arena_id, win=None, duration=None, player_id=None, name=None, points=None, damage=None, kills=None, vehicle=None):
-        player_data = self._get_player_data(arena_id, player_id)
-        if not player_data:
-            return False
+        with self._lock:
+            player_data = self._get_player_data(arena_id, player_id)
+            if not player_data:
+                return False
+
+            battle = self.data["BattleStats"][arena_id]
 
-        if duration is not None:
-            battle = self.get_battle(arena_id)
-            if battle:
-                battle["duration"] = duration
+            if duration is not None:
+                battle.duration = int(duration)
 
-        if win is not None:
-            battle = self.get_battle(arena_id)
-            if battle:
-                battle["win"] = win
+            if win is not None:
+                battle.win = int(win)
 
-        if name is not None:
-            player_data["name"] = unicode(name)
+            if name is not None:
+                player_data.name = intern_text(name)
 
-        if points is not None:
-            player_data["points"] = points
+            if points is not None:
+                player_data.points = int(points)
 
-        if damage is not None:
-            player_data["damage"] = damage
+            if damage is not None:
+                player_data.damage = int(damage)
 
-        if kills is not None:
-            player_data["kills"] = kills
+            if kills is not None:
+                player_data.kills = int(kills)
 
-        if vehicle is not None:
-            player_data["vehicle"] = unicode(vehicle)
+            if vehicle is not None:
+                player_data.vehicle = intern_text(vehicle)
 
+            self._touch_player(arena_id, player_id)
         return True
 
     def add_damage(self, arena_id, player_id, damage):
         if not isinstance(damage, (int, float)) or damage <= 0:
             return False
 
-        player_data = self._get_player_data(arena_id, player_id)
-        if player_data:
-        
-            player_data["damage"] += damage
-            return True
+        with self._lock:
+            player_data = self._get_player_data(arena_id, player_id)
+            if player_data:
+                player_data.damage += int(damage)
+                self._touch_player(arena_id, player_id)
+                return True
         return False
-    
+
     def add_kills(self, arena_id, player_id, kills):
         if not isinstance(kills, (int, float)) or kills <= 0:
             return False
 
-        player_data = self._get_player_data(arena_id, player_id)
-        if player_data:
-            player_data["kills"] += kills
-            return True
+        with self._lock:
+            player_data = self._get_player_data(arena_id, player_id)
+            if player_data:
+                player_data.kills += int(kills)
+                self._touch_player(arena_id, player_id)
+                return True
         return False
 
     def add_points(self, arena_id, player_id, points):
         if not isinstance(points, (int, float)) or points <= 0:
             return False
 
-        player_data = self._get_player_data(arena_id, player_id)
-        if player_data:
-            player_data["points"] += points
-            return True
+        with self._lock:
+            player_data = self._get_player_data(arena_id, player_id)
+            if player_data:
+                player_data.points += int(points)
+                self._touch_player(arena_id, player_id)
+                return True
         return False
 
+    def get_event_log(self, arena_id):
+        return self._event_logs.get(arena_id)
+
+    def _record_event(self, arena_id, player_id, event_type, attacker_id, target_id, damage, timestamp, tier=None):
+        with self._lock:
+            player_data = self._get_player_data(arena_id, player_id)
+            if not player_data:
+                return False
+            log = self._event_logs.get(arena_id)
+            if log is None:
+                # Both are anchored at battle start, not at the first hit, so
+                # rates and bucket indexes line up across players.
+                started_at = self.data["BattleStats"][arena_id].start_time or None
+                log = self._event_logs[arena_id] = BattleEventLog(arena_id, started_at)
+            log.append(event_type, attacker_id, target_id, damage, timestamp)
+            if event_type == EVENT_DAMAGE:
+                timeline = self._timelines.get(arena_id)
+                if timeline is None:
+                    timeline = self._timelines[arena_id] = DamageTimeline(log.started_at)
+                timeline.add(player_id, damage, timestamp)
+
+            # Live damage/kills are a view over the log for the player's own
+            # vehicle; points advance by the scored value of this event only.
+            damage_total, kills_total, _ = log.aggregate(attacker_id)
+            player_data.damage = damage_total
+            player_data.kills = kills_total
+            if event_type == EVENT_DAMAGE:
+                player_data.points += self.scoring.event_points(STAT_DAMAGE, damage, tier)
+            elif event_type == EVENT_KILL:
+                player_data.points += self.scoring.event_points(STAT_KILLS, 1, tier)
+            self._touch_player(arena_id, player_id)
+        return True
+
+    def record_damage(self, arena_id, player_id, attacker_id, target_id, damage, timestamp=None, tier=None):
+        if not isinstance(damage, (int, float)) or damage <= 0:
+            return False
+        return self._record_event(arena_id, player_id, EVENT_DAMAGE, attacker_id, target_id, damage, timestamp, tier)
+
+    def record_kill(self, arena_id, player_id, attacker_id, target_id, timestamp=None, tier=None):
+        return self._record_event(arena_id, player_id, EVENT_KILL, attacker_id, target_id, 0, timestamp, tier)
+
+    def get_timeline(self, arena_id):
+        return self._timelines.get(arena_id)
+
+    def timeline_delta(self, cursor_key, now=None):
+        wire = {}
+        marks = {}
+        with self._lock:
+            for arena_id, timeline in self._timelines.items():
+                delta, arena_marks = timeline.delta(cursor_key, now)
+                if delta:
+                    wire[str(arena_id)] = delta
+                if arena_marks:
+                    marks[arena_id] = arena_marks
+        return wire, marks
+
+    def ack_timeline(self, cursor_key, marks):
+        with self._lock:
+            for arena_id, arena_marks in marks.items():
+                timeline = self._timelines.get(arena_id)
+                if timeline is not None:
+                    timeline.ack(cursor_key, arena_marks)
+
+    def reconcile_events(self, arena_id, attacker_id, damage, kills):
+        with self._lock:
+            log = self._event_logs.get(arena_id)
+            if log is None:
+                return None
+            return log.reconcile(attacker_id, damage, kills)
+
+    def enforce_retention(self, now=None):
+        now = now or time.time()
+        spilled = []
+        with self._lock:
+            battles = self.data["BattleStats"]
+            evicted = self.battleRetention.select_evictions(
+                [(arena_id, self._battle_used.get(arena_id, now), self._battle_bytes(arena_id, battle))
+                 for arena_id, battle in battles.items()], now)
+            for arena_id in evicted:
+                battle = battles.pop(arena_id)
+                self._event_logs.pop(arena_id, None)
+                self._timelines.pop(arena_id, None)
+                self._touch_battle(arena_id)
+                self._evicted_battles += 1
+                if battle.players:
+                    spilled.append({'arenaId': arena_id, 'battle': battle.to_dict()})
+
+            player_info = self.data["PlayerInfo"]
+            evicted = self.playerInfoRetention.select_evictions(
+                [(player_id, self._player_info_used.get(player_id, now), estimate_player_info_bytes(player_name))
+                 for player_id, player_name in player_info.items()], now)
+            for player_id in evicted:
+                del player_info[player_id]
+                self._player_info_used.pop(player_id, None)
+                self._evicted_player_info += 1
+                self._touch_player_info(player_id)
+
+        if spilled:
+            self._spilled_battles += len(spilled)
+            worker = threading.Thread(target=self._spill_battles, args=(spilled,))
+            worker.daemon = True
+            worker.start()
+        return len(spilled)
+
+    def _spill_battles(self, records):
+        try:
+            self.spill.append(records)
+        except Exception:
+            pass
+
+    def take_spilled_battles(self):
+        return self.spill.take()
+
+    def restore_spilled_battles(self, records):
+        if records:
+            self.spill.append(records)
+
+    def spilled_snapshot(self, records):
+        battles = dict((record['arenaId'], record['battle']) for record in records
+                       if record.get('arenaId') and record.get('battle'))
+        return StatsWrapper(data={"BattleStats": battles}, scoring=self.scoring).snapshot()
+
+    def _battle_bytes(self, arena_id, battle):
+        size = estimate_battle_bytes(battle)
+        log = self._event_logs.get(arena_id)
+        if log is not None:
+            size += log.estimate_bytes()
+        timeline = self._timelines.get(arena_id)
+        if timeline is not None:
+            size += timeline.estimate_bytes()
+        return size
+
+    def get_usage(self):
+        with self._lock:
+            battles = list(self.data["BattleStats"].values())
+            player_names = list(self.data["PlayerInfo"].values())
+            battle_bytes = sum(self._battle_bytes(arena_id, battle) for arena_id, battle in self.data["BattleStats"].items())
+            events = sum(len(log) for log in self._event_logs.values())
+        player_info_bytes = sum(estimate_player_info_bytes(name) for name in player_names)
+        return {
+            'battles': len(battles),
+            'players': sum(len(battle.players) for battle in battles),
+            'playerInfo': len(player_names),
+            'events': events,
+            'bytes': battle_bytes + player_info_bytes,
+            'battleBytes': battle_bytes,
+            'playerInfoBytes': player_info_bytes,
+            'evictedBattles': self._evicted_battles,
+            'evictedPlayerInfo': self._evicted_player_info,
+            'spilledBattles': self._spilled_battles,
+            'version': self._version
+        }
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.version == self._version:
+                return snapshot
+
+            battles = {}
+            battles_json = {}
+            for arena_id, battle in self.data["BattleStats"].items():
+                cached = self._battle_wire.get(arena_id)
+                if cached is None:
+                    cached = self._build_battle_wire(arena_id, battle)
+                    self._battle_wire[arena_id] = cached
+                battles[str(arena_id)], battles_json[str(arena_id)] = cached
+
+            if self._player_info_wire is None:
+                wire = {}
+                entries_json = []
+                for player_id, player_name in self.data["PlayerInfo"].items():
+                    entry_json = self._player_info_json.get(player_id)
+                    if entry_json is None:
+                        entry_json = encode_json(str(player_id)) + u':' + encode_json(player_name)
+                        self._player_info_json[player_id] = entry_json
+                    wire[str(player_id)] = player_name
+                    entries_json.append(entry_json)
+                self._player_info_wire = (wire, u'{' + u','.join(entries_json) + u'}')
+
+            snapshot = StatsSnapshot(self._version, battles, self._player_info_wire[0],
+                                     battles_json, self._player_info_wire[1])
+            self._snapshot = snapshot
+            return snapshot
+
+    def _build_battle_wire(self, arena_id, battle):
+        # Only players touched since the last snapshot are re-encoded; the
+        # battle fragment is then spliced together from cached player text.
+        fragments = self._player_wire.get(arena_id)
+        if fragments is None:
+            fragments = self._player_wire[arena_id] = {}
+        players_wire = {}
+        players_json = []
+        for player_id, player in battle.players.items():
+            fragment = fragments.get(player_id)
+            if fragment is None:
+                wire = player.to_wire()
+                fragment = fragments[player_id] = (wire, encode_json(wire))
+            key = str(player_id)
+            players_wire[key] = fragment[0]
+            players_json.append(encode_json(key) + u':' + fragment[1])
+
+        wire = battle.header_wire()
+        header_json = encode_json(wire)
+        wire["players"] = players_wire
+        text = header_json[:-1] + u',"players":{' + u','.join(players_json) + u'}}'
+        return wire, text
+
     def get_raw_data(self):
-        return self.data
-    
+        return {
+            "BattleStats": dict((arena_id, battle.to_dict()) for arena_id, battle in self.data["BattleStats"].items()),
+            "PlayerInfo": dict(self.data["PlayerInfo"])
+        }
+
+    def get_wire_data(self):
+        snapshot = self.snapshot()
+        return {
+            "BattleStats": snapshot.battles,
+            "PlayerInfo": snapshot.player_info
+        }
+
     def clear_all_data(self):
-        self.data = {"BattleStats": {}, "PlayerInfo": {}}
+        with self._lock:
+            self.data = {"BattleStats": {}, "PlayerInfo": {}}
+            self._battle_wire = {}
+            self._player_wire = {}
+            self._event_logs = {}
+            self._timelines = {}
+            self._battle_used = {}
+            self._player_info_used = {}
+            self._touch_player_info()
 
     def clear_current_battle_data(self, arena_id):
-        if arena_id in self.data["BattleStats"]:
-            del self.data["BattleStats"][arena_id]
\ No newline at end of file
+        with self._lock:
+            self._event_logs.pop(arena_id, None)
+            self._timelines.pop(arena_id, None)
+            if arena_id in self.data["BattleStats"]:
+                del self.data["BattleStats"][arena_id]
+                self._touch_battle(arena_id)
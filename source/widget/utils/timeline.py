@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import time
+from array import array
+
+BUCKET_SECONDS = 1.0
+BUCKET_CAPACITY = 900
+RATE_WINDOW = 10
+
+
+class DamageSeries(object):
+    # Ring of cumulative damage at the end of each bucket. A single bucket is
+    # cumulative[b] - cumulative[b - 1] and any window is one subtraction.
+    __slots__ = ('start', 'bucket_seconds', 'capacity', 'cumulative', 'last_bucket', 'total')
+
+    def __init__(self, start, bucket_seconds=BUCKET_SECONDS, capacity=BUCKET_CAPACITY):
+        self.start = start
+        self.bucket_seconds = bucket_seconds
+        self.capacity = capacity
+        self.cumulative = array('i', [0]) * capacity
+        self.last_bucket = 0
+        self.total = 0
+
+    def bucket_at(self, timestamp):
+        return max(0, int((timestamp - self.start) / self.bucket_seconds))
+
+    def advance(self, bucket):
+        if bucket <= self.last_bucket:
+            return
+        first = max(self.last_bucket + 1, bucket - self.capacity + 1)
+        for index in range(first, bucket + 1):
+            self.cumulative[index % self.capacity] = self.total
+        self.last_bucket = bucket
+
+    def add(self, damage, timestamp):
+        # Late events land in the newest bucket so the ring never rewinds.
+        self.advance(self.bucket_at(timestamp))
+        self.total += int(damage)
+        self.cumulative[self.last_bucket % self.capacity] = self.total
+
+    def _cumulative_at(self, bucket):
+        if bucket < 0:
+            return 0
+        return self.cumulative[bucket % self.capacity]
+
+    def bucket_value(self, bucket):
+        return self._cumulative_at(bucket) - self._cumulative_at(bucket - 1)
+
+    def window_sum(self, buckets, now):
+        self.advance(self.bucket_at(now))
+        buckets = min(buckets, self.capacity - 1)
+        return self._cumulative_at(self.last_bucket) - self._cumulative_at(self.last_bucket - buckets)
+
+    def rate(self, now, window=RATE_WINDOW):
+        buckets = max(1, int(window / self.bucket_seconds))
+        return self.window_sum(buckets, now) / float(buckets * self.bucket_seconds)
+
+    def per_minute(self, now):
+        elapsed = max(now - self.start, self.bucket_seconds)
+        return self.total * 60.0 / elapsed
+
+    def closed_since(self, first_bucket, now):
+        current = self.bucket_at(now)
+        self.advance(current)
+        first_bucket = max(first_bucket, current - self.capacity + 2, 0)
+        return first_bucket, [self.bucket_value(bucket) for bucket in range(first_bucket, current)]
+
+
+class DamageTimeline(object):
+    def __init__(self, start=None, bucket_seconds=BUCKET_SECONDS, capacity=BUCKET_CAPACITY):
+        self.start = start if start is not None else time.time()
+        self.bucket_seconds = bucket_seconds
+        self.capacity = capacity
+        self.series = {}
+        self._acked = {}
+
+    def add(self, player_id, damage, timestamp=None):
+        series = self.series.get(player_id)
+        if series is None:
+            series = self.series[player_id] = DamageSeries(self.start, self.bucket_seconds, self.capacity)
+        series.add(damage, timestamp if timestamp is not None else time.time())
+
+    def delta(self, cursor_key, now=None):
+        # Returns (wire, marks): buckets closed since the last acknowledged
+        # update for cursor_key, plus the marks to pass to ack() on success.
+        now = now if now is not None else time.time()
+        wire = {}
+        marks = {}
+        acked = self._acked.get(cursor_key, {})
+        for player_id, series in self.series.items():
+            first, buckets = series.closed_since(acked.get(player_id, 0), now)
+            entry = {
+                "dps": round(series.rate(now), 1),
+                "dpm": int(series.per_minute(now))
+            }
+            if buckets:
+                entry["from"] = first
+                entry["buckets"] = buckets
+                marks[player_id] = first + len(buckets)
+            wire[str(player_id)] = entry
+        if not wire:
+            return None, marks
+        return {"bucket": self.bucket_seconds, "players": wire}, marks
+
+    def ack(self, cursor_key, marks):
+        acked = self._acked.setdefault(cursor_key, {})
+        for player_id, mark in marks.items():
+            acked[player_id] = max(acked.get(player_id, 0), mark)
+
+    def reset_cursor(self, cursor_key):
+        self._acked.pop(cursor_key, None)
+
+    def estimate_bytes(self):
+        return len(self.series) * (self.capacity * 4 + 96)